@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
 from .concept_arg import ConceptArg
-from .filter_range_arg import FilterRangeArg
+from .filter_range_arg import FilterIndex, FilterRangeArg
 from .keyword_arg import KeywordArg
 from .rule_range_arg import RuleRangeArg
@@ -19,34 +19,61 @@ class ConceptArg(object):
             3. 下划线
 
     由于在编写过程中的先后顺序可能会导致概念的引用比初始化早的情况发生,
-    所以初始化 ConceptArg 时不会直接获取 Concept 对象, 而是在 match 的时候动态获取.
+    所以初始化 ConceptArg 时不会直接获取 Concept 对象, 而是在 match 的时候通过 TextContext 动态获取.
+    同一篇文档中, 概念的结果由 TextContext 缓存, 多次引用只会计算一次.
     """
 
-    def __init__(self, config, name, concept_mgr):
+    def __init__(self, config, name):
         """
         初始化一个概念参数
         :param config: 存储配置信息的对象
         :param name: 概念名称, 全局唯一
-        :param concept_mgr: 用来存储管理 concept_name => Concept 的对象
         """
         self.config = config
         self.name = name
-        self.concept_mgr = concept_mgr
 
     def __str__(self):
         return 'ConceptArg(name={0})'.format(
             self.name,
         )
 
-    def match(self, text):
+    def find_triggers(self, concept_triggers):
+        """
+        计算命中该参数的必要关键词集合 (至少出现其中一个), 即被引用概念的必要关键词集合
+        :param concept_triggers: 已经计算好的 concept_name => 必要关键词集合
+        :return: 返回关键词集合, None 表示无法确定
+        """
+        return concept_triggers.get(self.name)
+
+    def structure(self):
+        """
+        用于判断子规则是否相同的结构
+        :return: 返回 tuple
+        """
+        return 'ConceptArg', self.name
+
+    def compile(self, shared=None):
+        """
+        编译成匹配函数, 概念的结果通过 TextContext 获取 (每篇文档只计算一次)
+        :param shared: 共享子规则的 SharedPlans 对象, 见 lre.plan, None 表示不共享
+        :return: 返回 match(text, limit=None) 函数
+        """
+        name = self.name
+
+        def match(text, limit=None):
+            return text.match_concept(name, limit)
+
+        return match
+
+    def match(self, text, limit=None):
         """
         匹配对象进行文本的规则匹配
-        :param text: 待匹配的 Text 对象
+        :param text: 待匹配的 TextContext 对象
+        :param limit: 需要的结果数目, 见 TextContext.match_concept
         :return: 返回查找到的 Results 对象
         """
         # 不存在会报错, 这里我考虑如果做兼容性考量, 生成一个不起任何作用的 ConceptArg,
         # 势必会带来 "不好探查的错误", 因为从实际使用角度来说不存在无意义的空概念存在,
         # 只可能是拼写错误之类的错误导致, 所以报错可以让用户在测试阶段就发现问题.
-        concept = self.concept_mgr.get(self.name)
-        results = concept.match(text)
+        results = text.match_concept(self.name, limit)
         return results
@@ -4,9 +4,83 @@
 """
 from __future__ import unicode_literals
 
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
 import six
 
 
+def has_between(sorted_values, lo, hi):
+    """
+    判断有序列表中是否存在 [lo, hi] 范围内的值
+    :param sorted_values: 升序排列的列表
+    :param lo: 范围下界 (闭区间)
+    :param hi: 范围上界 (闭区间)
+    :return: 返回是否存在
+    """
+    i = bisect_left(sorted_values, lo)
+    return i < len(sorted_values) and sorted_values[i] <= hi
+
+
+class FilterIndex(object):
+    """
+    过滤结果的索引. 每次匹配只需要对过滤规则的结果建立一次索引, 之后对每个目标结果的范围判断都通过二分查找完成.
+
+        * 前向过滤关心过滤结果的结束位置, 后向过滤关心过滤结果的起始位置
+        * 按照段落/句子分桶, 桶内按照 offset/句子序号排序
+        * 重叠判断使用按起始位置排序的结果及其结束位置的前缀最大值
+    """
+
+    def __init__(self, filter_results):
+        """
+        :param filter_results: 过滤规则匹配到的 Results 对象
+        """
+        self.results = filter_results
+
+        # Results 本身按照起始位置排序, 同时提供按照结束位置排序的列表
+        by_beg = filter_results
+        by_end = filter_results.by_end
+
+        # 全文范围, 以及重叠判断
+        self.beg_offsets = [x.beg_index.offset for x in by_beg]
+        self.end_offsets = [x.end_index.offset for x in by_end]
+        self.max_end_offsets = []
+        max_end_offset = -1
+        for result in by_beg:
+            max_end_offset = max(max_end_offset, result.end_index.offset)
+            self.max_end_offsets.append(max_end_offset)
+
+        # 按句子分桶: (i_para, i_sent) => offset 列表
+        self.beg_offsets_by_sent = defaultdict(list)
+        self.end_offsets_by_sent = defaultdict(list)
+        # 按段落分桶: i_para => offset 列表
+        self.beg_offsets_by_para = defaultdict(list)
+        self.end_offsets_by_para = defaultdict(list)
+        # 按段落分桶: i_para => 句子序号列表
+        self.beg_sents_by_para = defaultdict(list)
+        self.end_sents_by_para = defaultdict(list)
+        # 段落序号列表
+        self.beg_paras = []
+        self.end_paras = []
+
+        # 按照 offset 顺序加入, 保证每个桶内都是有序的
+        for result in by_beg:
+            index = result.beg_index
+            self.beg_offsets_by_sent[(index.i_para, index.i_sent)].append(index.offset)
+            self.beg_offsets_by_para[index.i_para].append(index.offset)
+            self.beg_sents_by_para[index.i_para].append(index.i_sent)
+            self.beg_paras.append(index.i_para)
+        for result in by_end:
+            index = result.end_index
+            self.end_offsets_by_sent[(index.i_para, index.i_sent)].append(index.offset)
+            self.end_offsets_by_para[index.i_para].append(index.offset)
+            self.end_sents_by_para[index.i_para].append(index.i_sent)
+            self.end_paras.append(index.i_para)
+
+    def __len__(self):
+        return len(self.beg_offsets)
+
+
 @six.python_2_unicode_compatible
 class FilterRangeArg(object):
 
@@ -44,158 +118,132 @@ class FilterRangeArg(object):
             self.backward_n,
         )
 
-    def filter_d(self, target_result, filter_results, n, dir):
+    def structure(self):
+        """
+        用于判断子规则是否相同的结构
+        :return: 返回 tuple
+        """
+        return 'FilterRangeArg', self.forward_unit, self.forward_n, self.is_overlap, self.backward_unit, self.backward_n
+
+    def filter_d(self, target_result, filter_index, n, dir):
         """
-        单位为 d 的过滤判断
-        :param filter_results: 进行过滤的结果
+        单位为 d 的过滤判断, 过滤结果与目标结果在同一句子中, 相距不超过 n 个词
         :param target_result: 待过滤的目标结果
+        :param filter_index: 过滤结果的 FilterIndex 对象
         :param n: 单位对应的 n
         :param dir: 前向或后向, 仅支持 forward / backward
         :return: 返回是否过滤
         """
-        for fr in filter_results:
-            # 不与自己进行比较
-            if fr == target_result:
-                continue
-
-            if dir == 'forward':
-                if fr.end_index.i_para == target_result.beg_index.i_para \
-                        and fr.end_index.i_sent == target_result.beg_index.i_sent \
-                        and target_result.beg_index.i_word > fr.end_index.i_word >= target_result.beg_index.i_word - n:
-                    return True
-            elif dir == 'backward':
-                if fr.beg_index.i_para == target_result.end_index.i_para \
-                        and fr.beg_index.i_sent == target_result.end_index.i_sent \
-                        and target_result.end_index.i_word < fr.beg_index.i_word <= target_result.end_index.i_word + n:
-                    return True
-            else:
-                raise ValueError('invalid dir parameter')
-
-        return False
+        # 同一句子中 offset 和 i_word 的差值是一样的, 直接使用 offset 判断
+        if dir == 'forward':
+            index = target_result.beg_index
+            offsets = filter_index.end_offsets_by_sent.get((index.i_para, index.i_sent))
+            return offsets is not None and has_between(offsets, index.offset - n, index.offset - 1)
+        elif dir == 'backward':
+            index = target_result.end_index
+            offsets = filter_index.beg_offsets_by_sent.get((index.i_para, index.i_sent))
+            return offsets is not None and has_between(offsets, index.offset + 1, index.offset + n)
+        else:
+            raise ValueError('invalid dir parameter')
 
-    def filter_w(self, target_result, filter_results, n, dir):
+    def filter_w(self, target_result, filter_index, n, dir):
         """
-        单位为 w 的过滤判断
-        :param filter_results: 进行过滤的结果
+        单位为 w 的过滤判断, 过滤结果与目标结果在同一段落中, 相距不超过 n 个词
         :param target_result: 待过滤的目标结果
+        :param filter_index: 过滤结果的 FilterIndex 对象
         :param n: 单位对应的 n
         :param dir: 前向或后向, 仅支持 forward / backward
         :return: 返回是否过滤
         """
-        for fr in filter_results:
-            # 不与自己进行比较
-            if fr == target_result:
-                continue
-
-            if dir == 'forward':
-                if fr.end_index.i_para == target_result.beg_index.i_para \
-                        and target_result.beg_index.offset > fr.end_index.offset >= target_result.beg_index.offset - n:
-                    return True
-            elif dir == 'backward':
-                if fr.beg_index.i_para == target_result.end_index.i_para \
-                        and target_result.end_index.offset < fr.beg_index.offset <= target_result.end_index.offset + n:
-                    return True
-            else:
-                raise ValueError('invalid dir parameter')
-
-        return False
+        if dir == 'forward':
+            index = target_result.beg_index
+            offsets = filter_index.end_offsets_by_para.get(index.i_para)
+            return offsets is not None and has_between(offsets, index.offset - n, index.offset - 1)
+        elif dir == 'backward':
+            index = target_result.end_index
+            offsets = filter_index.beg_offsets_by_para.get(index.i_para)
+            return offsets is not None and has_between(offsets, index.offset + 1, index.offset + n)
+        else:
+            raise ValueError('invalid dir parameter')
 
-    def filter_s(self, target_result, filter_results, n, dir):
+    def filter_s(self, target_result, filter_index, n, dir):
         """
-        单位为 s 的过滤判断
-        :param filter_results: 进行过滤的结果
+        单位为 s 的过滤判断, 过滤结果与目标结果在同一段落中, 相距不超过 n 个句子
         :param target_result: 待过滤的目标结果
+        :param filter_index: 过滤结果的 FilterIndex 对象
         :param n: 单位对应的 n
         :param dir: 前向或后向, 仅支持 forward / backward
         :return: 返回是否过滤
         """
-        for fr in filter_results:
-            # 不与自己进行比较
-            if fr == target_result:
-                continue
-
-            if dir == 'forward':
-                if fr.end_index.i_para == target_result.beg_index.i_para \
-                        and target_result.beg_index.i_sent > fr.end_index.i_sent >= target_result.beg_index.i_sent - n:
-                    return True
-            elif dir == 'backward':
-                if fr.beg_index.i_para == target_result.end_index.i_para \
-                        and target_result.end_index.i_sent < fr.beg_index.i_sent <= target_result.end_index.i_sent + n:
-                    return True
-            else:
-                raise ValueError('invalid dir parameter')
-
-        return False
+        if dir == 'forward':
+            index = target_result.beg_index
+            sents = filter_index.end_sents_by_para.get(index.i_para)
+            return sents is not None and has_between(sents, index.i_sent - n, index.i_sent - 1)
+        elif dir == 'backward':
+            index = target_result.end_index
+            sents = filter_index.beg_sents_by_para.get(index.i_para)
+            return sents is not None and has_between(sents, index.i_sent + 1, index.i_sent + n)
+        else:
+            raise ValueError('invalid dir parameter')
 
-    def filter_p(self, target_result, filter_results, n, dir):
+    def filter_p(self, target_result, filter_index, n, dir):
         """
-        单位为 p 的过滤判断
-        :param filter_results: 进行过滤的结果
+        单位为 p 的过滤判断, 过滤结果与目标结果相距不超过 n 个段落
         :param target_result: 待过滤的目标结果
+        :param filter_index: 过滤结果的 FilterIndex 对象
         :param n: 单位对应的 n
         :param dir: 前向或后向, 仅支持 forward / backward
         :return: 返回是否过滤
         """
-        for fr in filter_results:
-            # 不与自己进行比较
-            if fr == target_result:
-                continue
-
-            if dir == 'forward':
-                if target_result.beg_index.i_para > fr.end_index.i_para >= target_result.beg_index.i_para - n:
-                    return True
-            elif dir == 'backward':
-                if target_result.end_index.i_para < fr.beg_index.i_para <= target_result.end_index.i_para + n:
-                    return True
-            else:
-                raise ValueError('invalid dir parameter')
+        if dir == 'forward':
+            i_para = target_result.beg_index.i_para
+            return has_between(filter_index.end_paras, i_para - n, i_para - 1)
+        elif dir == 'backward':
+            i_para = target_result.end_index.i_para
+            return has_between(filter_index.beg_paras, i_para + 1, i_para + n)
+        else:
+            raise ValueError('invalid dir parameter')
 
-        return False
-
-    def filter_t(self, target_result, filter_results, n, dir):
+    def filter_t(self, target_result, filter_index, n, dir):
         """
-        单位为 t 的过滤判断
-        :param filter_results: 进行过滤的结果
+        单位为 t 的过滤判断, 过滤结果在目标结果之前/之后即可
         :param target_result: 待过滤的目标结果
+        :param filter_index: 过滤结果的 FilterIndex 对象
         :param n: 单位对应的 n
         :param dir: 前向或后向, 仅支持 forward / backward
         :return: 返回是否过滤
         """
-        for fr in filter_results:
-            # 不与自己进行比较
-            if fr == target_result:
-                continue
-
-            if dir == 'forward':
-                if fr.end_index.offset < target_result.beg_index.offset:
-                    return True
-            elif dir == 'backward':
-                if fr.beg_index.offset > target_result.end_index.offset:
-                    return True
-            else:
-                raise ValueError('invalid dir parameter')
-
-        return False
+        if dir == 'forward':
+            offsets = filter_index.end_offsets
+            return len(offsets) > 0 and offsets[0] < target_result.beg_index.offset
+        elif dir == 'backward':
+            offsets = filter_index.beg_offsets
+            return len(offsets) > 0 and offsets[-1] > target_result.end_index.offset
+        else:
+            raise ValueError('invalid dir parameter')
 
-    def filter_overlap(self, target_result, filter_results):
+    def filter_overlap(self, target_result, filter_index):
         """
-        重叠过滤的判断
-        :param filter_results: 进行过滤的结果
+        重叠过滤的判断, 存在起始位置不晚于目标结束位置, 且结束位置不早于目标起始位置的过滤结果
         :param target_result: 待过滤的目标结果
+        :param filter_index: 过滤结果的 FilterIndex 对象
         :return: 返回是否过滤
         """
-        for fr in filter_results:
-            if target_result.overlap(fr):
-                return True
-        return False
+        i = bisect_right(filter_index.beg_offsets, target_result.end_index.offset)
+        return i > 0 and filter_index.max_end_offsets[i - 1] >= target_result.beg_index.offset
 
     def filter(self, target_result, filter_results):
         """
         对某个目标规则的结果进行过滤
         :param target_result: 目标规则的结果
-        :param filter_results: 进行过滤的过滤规则匹配到的结果
+        :param filter_results: 进行过滤的过滤规则匹配到的结果, 对多个目标结果过滤时应传入建立好的 FilterIndex 对象
         :return: 返回是否要将 target_result 过滤
         """
+        if not isinstance(filter_results, FilterIndex):
+            filter_results = FilterIndex(filter_results)
+        if len(filter_results) == 0:
+            return False
+
         if self.forward_n > 0:
             func = self.unit_map[self.forward_unit]
             if func(target_result, filter_results, self.forward_n, 'forward'):
@@ -6,7 +6,7 @@ from __future__ import unicode_literals
 
 import six
 
-from ..result import Results
+from ..result import EMPTY_RESULTS
 from ..rule import SeqRule
 from .rule_range_arg import s_range_arg
 
@@ -23,18 +23,46 @@ class SingleKeywordArg(object):
         """
         self.word = word
 
-    def match(self, text):
+    def find_triggers(self, concept_triggers):
+        """
+        计算命中该参数的必要关键词集合 (至少出现其中一个)
+        :param concept_triggers: 已经计算好的 concept_name => 必要关键词集合
+        :return: 返回关键词集合
+        """
+        return frozenset([self.word])
+
+    def structure(self):
+        """
+        用于判断子规则是否相同的结构, 与只有一个词的 KeywordArg 相同
+        :return: 返回 tuple
+        """
+        return 'KeywordArg', self.word
+
+    def compile(self, shared=None):
+        """
+        编译成匹配函数, 见 Concept.compile
+        :param shared: 共享子规则的 SharedPlans 对象, 见 lre.plan, None 表示不共享
+        :return: 返回 match(text, limit=None) 函数
+        """
+        word = self.word
+
+        def match(text, limit=None):
+            results = text.word_map.get(word)
+            if results is None:  # 没有结果返回空
+                return EMPTY_RESULTS
+            else:
+                return results
+
+        return match
+
+    def match(self, text, limit=None):
         """
         匹配对象进行文本的关键词匹配.
         :param text: 待匹配的 Text 对象
+        :param limit: 需要的结果数目, 关键词的结果已经存在, 直接返回全部
         :return: 返回查找到的 Results 对象, 如果不存在返回空的 Results
         """
-        results = text.word_map.get(self.word)
-
-        if results is None:  # 没有结果返回空
-            return Results()
-        else:
-            return results
+        return self.compile()(text, limit)
 
 
 @six.python_2_unicode_compatible
@@ -57,20 +85,48 @@ class KeywordArg(object):
         for word in words:
             self.words.append(SingleKeywordArg(word))
         self.config = config
+        # 多个词的情况通过 SeqRule 匹配, 只需要生成一次
+        if len(self.words) > 1:
+            self.seq_rule = SeqRule(self.config, s_range_arg, *self.words)
+        else:
+            self.seq_rule = None
 
     def __str__(self):
         return 'KeywordArg(words=[{0}])'.format(
             ', '.join([x.word for x in self.words]),
         )
 
-    def match(self, text):
+    def find_triggers(self, concept_triggers):
+        """
+        计算命中该参数的必要关键词集合 (至少出现其中一个), 所有词都必须出现, 取第一个即可
+        :param concept_triggers: 已经计算好的 concept_name => 必要关键词集合
+        :return: 返回关键词集合
+        """
+        return self.words[0].find_triggers(concept_triggers)
+
+    def structure(self):
+        """
+        用于判断子规则是否相同的结构
+        :return: 返回 tuple
+        """
+        return ('KeywordArg',) + tuple(x.word for x in self.words)
+
+    def compile(self, shared=None):
+        """
+        编译成匹配函数, 单个词直接查找 word_map, 多个词使用 SeqRule 的匹配函数
+        :param shared: 共享子规则的 SharedPlans 对象, 见 lre.plan, None 表示不共享
+        :return: 返回 match(text, limit=None) 函数
+        """
+        if self.seq_rule is None:
+            return self.words[0].compile()
+        else:  # self.words > 1 的情况
+            return self.seq_rule.compile()
+
+    def match(self, text, limit=None):
         """
         匹配对象进行文本的关键词匹配.
         :param text: 待匹配的 Text 对象
+        :param limit: 需要的结果数目, None 表示需要全部结果
         :return: 返回查找到的 Results 对象, 如果不存在返回空的 Results
         """
-        if len(self.words) == 1:
-            return self.words[0].match(text)
-        else:  # self.words > 1 的情况
-            seq_rule = SeqRule(self.config, s_range_arg, *self.words)
-            return seq_rule.match(text)
+        return self.compile()(text, limit)
@@ -46,70 +46,99 @@ class RuleRangeArg(object):
     def __str__(self):
         return 'RuleRangeArg(unit={0}, n={1})'.format(self.unit, self.n)
 
-    def filter(self, results):
+    def structure(self):
         """
-        对已经匹配的对象进行范围过滤，滤除不合规格的
-        :param results: 已经匹配的结果
-        :return: 返回滤除后的合规范结果
+        用于判断子规则是否相同的结构
+        :return: 返回 tuple
         """
+        return 'RuleRangeArg', self.unit, self.n
 
-        def filter_d(result):
-            """
-            不跨句子的词/字级别范围判断
-            """
-            if result.end_index.i_para == result.beg_index.i_para \
-                    and result.end_index.i_sent == result.beg_index.i_sent:
+    def accept(self, beg_index, end_index, bias):
+        """
+        判断一个结果是否在范围内
+        :param beg_index: 结果的起始 Index 对象 (闭区间)
+        :param end_index: 结果的结束 Index 对象 (闭区间)
+        :param bias: 结果的偏离量
+        :return: 返回是否在范围内
+        """
+        if self.unit == 't':  # 整个文本
+            return True
+        elif self.unit == 'd':  # 不跨越句子的词条数目
+            if end_index.i_para == beg_index.i_para and end_index.i_sent == beg_index.i_sent:
                 # 字/词的判断
                 if self.config.force_concept_size_one:  # concept 强制为长度 1
-                    return result.end_index.i_word - result.beg_index.i_word + 1 - result.bias <= self.n
+                    return end_index.i_word - beg_index.i_word + 1 - bias <= self.n
                 else:  # concept 不强制为长度 1
-                    return result.end_index.i_word - result.beg_index.i_word + 1 <= self.n
+                    return end_index.i_word - beg_index.i_word + 1 <= self.n
             else:  # 段落/句子已经不满足
                 return False
-
-        def filter_w(result):
-            """
-            跨句子的词/字级别范围判断
-            """
-            if result.end_index.i_para == result.beg_index.i_para:
+        elif self.unit == 'w':  # 跨越句子的词条数目
+            if end_index.i_para == beg_index.i_para:
                 if self.config.force_concept_size_one:  # concept 强制为长度 1
-                    return result.end_index.offset - result.beg_index.offset + 1 - result.bias <= self.n
+                    return end_index.offset - beg_index.offset + 1 - bias <= self.n
                 else:  # concept 不强制为长度 1
-                    return result.end_index.offset - result.beg_index.offset + 1 <= self.n
+                    return end_index.offset - beg_index.offset + 1 <= self.n
             else:
                 return False
+        elif self.unit == 's':  # 句子数目, 不跨段落
+            return end_index.i_para == beg_index.i_para \
+                   and end_index.i_sent - beg_index.i_sent + 1 <= self.n
+        elif self.unit == 'p':  # 段落数目
+            return end_index.i_para - beg_index.i_para + 1 <= self.n
+        else:
+            raise ValueError('invalid unit', self.unit)
 
-        def filter_s(result):
-            """
-            不跨段落的句子级别范围判断
-            """
-            return result.end_index.i_para == result.beg_index.i_para \
-                   and result.end_index.i_sent - result.beg_index.i_sent + 1 <= self.n
+    def out_of_range(self, beg_index, bias, index):
+        """
+        用于连接过程中的剪枝. 判断一个覆盖 beg_index 到 index 的连接结果是否必然超出范围,
+        其中 bias 为已知部分的累计偏离量.
 
-        def filter_p(result):
-            """
-            段落级别的范围判断
-            """
-            return result.end_index.i_para - result.beg_index.i_para + 1 <= self.n
+        结果的偏离量不会超过其长度减 1, 所以连接后的长度至少为 beg_index 到 index 的长度减去 bias. 例如:
 
-        if self.unit == 't':  # 整个文本的不用过滤
-            return results
+            * 部分结果从 beg_index 开始, 待连接的结果从 index 开始 (向后连接)
+            * 待连接的结果在 beg_index 结束, 部分结果在 index 结束 (向前连接)
 
-        # 依据 unit 来选定过滤函数, 过滤函数为 "留下的条件"
-        if self.unit == 'd':  # 不跨越句子的词条数目
-            filter_func = filter_d
-        elif self.unit == 'w':  # 跨越句子的词条数目
-            filter_func = filter_w
-        elif self.unit == 's':  # 句子数目
-            filter_func = filter_s
-        elif self.unit == 'p':  # 段落数目
-            filter_func = filter_p
+        对于按照位置排序的待连接结果, 一旦返回 True, 更远的结果也都会超出范围.
+        :param beg_index: 连接结果中靠前的 Index 对象
+        :param bias: 部分结果的累计偏离量
+        :param index: 连接结果中靠后的 Index 对象
+        :return: 返回是否必然超出范围
+        """
+        if self.unit == 't':
+            return False
+        elif self.unit == 'd':
+            if index.i_para != beg_index.i_para or index.i_sent != beg_index.i_sent:
+                return True
+            if self.config.force_concept_size_one:
+                return index.i_word - beg_index.i_word + 1 - bias > self.n
+            else:
+                return index.i_word - beg_index.i_word + 1 > self.n
+        elif self.unit == 'w':
+            if index.i_para != beg_index.i_para:
+                return True
+            if self.config.force_concept_size_one:
+                return index.offset - beg_index.offset + 1 - bias > self.n
+            else:
+                return index.offset - beg_index.offset + 1 > self.n
+        elif self.unit == 's':
+            return index.i_para != beg_index.i_para or index.i_sent - beg_index.i_sent + 1 > self.n
+        elif self.unit == 'p':
+            return index.i_para - beg_index.i_para + 1 > self.n
         else:
             raise ValueError('invalid unit', self.unit)
 
+    def filter(self, results):
+        """
+        对已经匹配的对象进行范围过滤，滤除不合规格的
+        :param results: 已经匹配的结果
+        :return: 返回滤除后的合规范结果
+        """
+        if self.unit == 't':  # 整个文本的不用过滤
+            return results
+
         ret_results = Results()
         for result in results:
-            if filter_func(result):
+            if self.accept(result.beg_index, result.end_index, result.bias):
                 ret_results.add(result)
 
         return ret_results
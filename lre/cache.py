@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+有容量上限和过期时间的 LRU 缓存
+"""
+from __future__ import unicode_literals
+
+import threading
+import time
+from collections import OrderedDict
+
+import six
+
+
+@six.python_2_unicode_compatible
+class LRUCache(object):
+    """
+    线程安全的 LRU 缓存. 每个条目有一个权重 (默认为 1), 所有条目的权重之和不超过 max_size,
+    超过时淘汰最久没有使用的条目. 设置了 ttl 时, 超过 ttl 秒的条目视为不存在.
+    """
+
+    def __init__(self, max_size, ttl=None, weigh=None, clock=time.time):
+        """
+        :param max_size: 所有条目的权重之和的上限
+        :param ttl: 条目的有效时间 (秒), None 表示不过期
+        :param weigh: 计算条目权重的函数, 输入为 value, 默认每个条目的权重为 1
+        :param clock: 获取当前时间的函数
+        """
+        if max_size <= 0:
+            raise ValueError('max_size should be positive', max_size)
+        self.max_size = max_size
+        self.ttl = ttl
+        self.weigh = weigh
+        self.clock = clock
+        # key => (value, 权重, 过期时间)
+        self.__items = OrderedDict()
+        self.__lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __str__(self):
+        return 'LRUCache(size={0}/{1}, items={2})'.format(self.size, self.max_size, len(self))
+
+    def __len__(self):
+        return len(self.__items)
+
+    def get(self, key, default=None):
+        """
+        获取缓存的值, 命中时该条目变为最近使用
+        :param key: 缓存的 key
+        :param default: 不存在或者已经过期时返回的值
+        :return: 返回缓存的值
+        """
+        with self.__lock:
+            item = self.__items.get(key)
+            if item is not None and item[2] is not None and item[2] <= self.clock():
+                self.__remove(key)
+                self.expirations += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            # 移到最后 (最近使用), 兼容没有 move_to_end 的 python2
+            del self.__items[key]
+            self.__items[key] = item
+            return item[0]
+
+    def put(self, key, value):
+        """
+        添加或者替换一个条目, 权重超过 max_size 的条目不会被缓存
+        :param key: 缓存的 key
+        :param value: 缓存的值
+        """
+        weight = 1 if self.weigh is None else self.weigh(value)
+        expire_time = None if self.ttl is None else self.clock() + self.ttl
+        with self.__lock:
+            if key in self.__items:
+                self.__remove(key)
+            if weight > self.max_size:
+                return
+
+            self.__items[key] = (value, weight, expire_time)
+            self.size += weight
+            while self.size > self.max_size:
+                self.__remove(next(iter(self.__items)))
+                self.evictions += 1
+
+    def clear(self):
+        """
+        清空缓存, 统计信息保持不变
+        """
+        with self.__lock:
+            self.__items.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        返回统计信息的 dict, 包括 hits/misses/evictions/expirations/size/items, 以及命中率 hit_rate
+        """
+        with self.__lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': self.size,
+                'items': len(self.__items),
+                'hit_rate': float(self.hits) / total if total else 0.0,
+            }
+
+    def __remove(self, key):
+        """
+        删除一个条目, 调用方需要持有锁
+        """
+        value, weight, expire_time = self.__items.pop(key)
+        self.size -= weight
@@ -6,9 +6,11 @@ from __future__ import unicode_literals
 
 from ..arg import *
 from ..filter import *
+from ..plan import compile_node
 from ..result import Results
 from ..rule import *
 from ..syntax import SyntaxType
+from ..text import TextContext
 
 
 class Concept(object):
@@ -41,29 +43,187 @@ class Concept(object):
             raise ValueError('concept has one rule or filter at least', syntax_parse_result)
         self.syntax_parse_result = syntax_parse_result
         self.rules_filters = self.build()
+        # 编译后的规则匹配函数和概念过滤函数, 规则树只用于展示和分析. 第一次匹配时才编译, 见 ensure_compiled
+        self.rule_matches = None
+        self.concept_filters = None
+        # 该概念直接引用的其他概念名称
+        self.dependencies = self.find_dependencies()
+        # 规则和过滤使用的范围, 见 find_ranges
+        self.ranges = self.find_ranges()
+        # 命中该概念的必要关键词集合 (至少出现其中一个), None 表示无法确定, 由 ConceptManager.build 计算
+        self.triggers = None
 
-    def match(self, text):
+    def __getstate__(self):
+        # 编译后的函数不能序列化, 加载后第一次匹配时重新编译
+        state = self.__dict__.copy()
+        state['rule_matches'] = None
+        state['concept_filters'] = None
+        return state
+
+    def __copy__(self):
+        # 复制时 (例如 reload 复用未修改的概念) 保留编译好的匹配函数, 不经过 __getstate__
+        ret = self.__class__.__new__(self.__class__)
+        ret.__dict__.update(self.__dict__)
+        return ret
+
+    def compile(self, shared=None):
         """
-        匹配操作, 该概念能匹配到什么结果
+        将规则树编译成执行计划: 每个规则/过滤器编译成一个匹配函数, 子节点的匹配函数、范围参数等在编译时绑定,
+        ArgRule 和 KeywordArg 等只做转发的节点直接使用其参数的匹配函数, 嵌套的 OrRule 直接展开.
+        匹配时只调用这些函数, 不再遍历规则树. 与其他概念共享的子规则见 ConceptManager.share_nodes
+        :param shared: 共享子规则的 SharedPlans 对象, 见 lre.plan, None 表示不共享
+        :return: 返回 (规则的匹配函数列表, 概念过滤函数列表)
+        """
+        rule_matches = []
+        concept_filters = []
+        for rule_or_filter in self.rules_filters:
+            if isinstance(rule_or_filter, ConceptFilter):
+                concept_filters.append(rule_or_filter.compile(shared))
+            else:
+                rule_matches.append(compile_node(rule_or_filter, shared))
+        return rule_matches, concept_filters
+
+    def ensure_compiled(self):
+        """
+        使用 manager 中共享的子规则编译并保存匹配函数, 已经编译过时直接返回. 多个线程同时编译时结果相同
+        """
+        if self.rule_matches is not None:
+            return
+        rule_matches, self.concept_filters = self.compile(self.concept_mgr.shared_plans)
+        # rule_matches 最后赋值, 其他线程看到它不为 None 时 concept_filters 已经就绪
+        self.rule_matches = rule_matches
+
+    def may_match(self, text):
+        """
+        依据必要关键词集合判断该概念是否有可能命中, 不可能命中的概念不需要运行任何规则
         :param text: 待匹配的文本 Text 对象
+        :return: 返回是否有可能命中
+        """
+        triggers = self.triggers
+        if triggers is None:
+            return True
+        word_map = text.word_map
+        if len(triggers) < len(word_map):
+            return any(word in word_map for word in triggers)
+        else:
+            return not triggers.isdisjoint(word_map)
+
+    def match(self, text, limit=None):
+        """
+        匹配操作, 该概念能匹配到什么结果
+        :param text: 待匹配的文本 Text 对象, 也可以是 TextContext 对象
+        :param limit: 需要的结果数目, 见 TextContext.match_concept
         :return: 返回匹配到的结果, 会使用 global_rules 进行过滤
         """
-        results = Results()
-        for rule_or_filter in self.rules_filters:
-            results.add(rule_or_filter.match(text))
+        # 单独匹配一个 Text 时, 生成一个上下文来缓存引用到的其他概念
+        if not isinstance(text, TextContext):
+            text = TextContext(text, self.concept_mgr)
+        if self.rule_matches is None:
+            self.ensure_compiled()
+        # 概念过滤会滤除部分结果, 需要全部结果
+        if self.concept_filters:
+            limit = None
+
+        if limit is None or not self.config.force_concept_size_one:
+            return self.resize(self.match_rules(text, limit))
 
-        # 修改每个 Result 的 bias
+        # 修改 bias 后范围相同的结果会合并, 只使用规则最早的 rule_limit 个结果, 不够时增加 rule_limit 重新匹配
+        rule_limit = limit
+        while True:
+            results = self.match_rules(text, rule_limit)
+            complete = len(results) < rule_limit
+            results = self.resize(results.head(rule_limit))
+            if len(results) >= limit or complete:
+                return results
+            rule_limit *= 4
+
+    def match_rules(self, text, limit=None):
+        """
+        合并所有规则的匹配结果, 再使用概念过滤
+        :param text: 待匹配的 TextContext 对象
+        :param limit: 需要的结果数目, 见 TextContext.match_concept. 只判断是否命中时 (TextContext.any_hit)
+                      按顺序匹配规则, 得到 limit 个结果即停止
+        :return: 返回合并后的 Results 对象
+        """
+        if limit is not None and text.any_hit:
+            results = Results.union_until((rule_match(text, limit) for rule_match in self.rule_matches), limit)
+        else:
+            results = Results.union([rule_match(text, limit) for rule_match in self.rule_matches])
+        for concept_filter in self.concept_filters:
+            results = concept_filter(text, results)
+        return results
+
+    def resize(self, results):
+        """
+        依据 config.force_concept_size_one 修改每个结果的 bias
+        :param results: 规则的匹配结果
+        :return: 返回修改后的 Results 对象, 不需要修改时直接返回 results
+        """
+        # 修改每个 Result 的 bias, Result 不可修改, 生成新的 Result
         if self.config.force_concept_size_one:
+            concept_results = Results()
             for result in results:
                 # 相同的段落/句子, 则 bias 设置为end_index.i_word - beg_index.i_word - 1
                 if result.beg_index.i_para == result.end_index.i_para \
                         and result.beg_index.i_sent == result.end_index.i_sent:
-                    result.bias = result.end_index.i_word - result.beg_index.i_word
+                    bias = result.end_index.i_word - result.beg_index.i_word
                 else:  # 不在一个段落/句子中, 则直接设置为总长度 - 1, 保证其长度直接为 1
-                    result.bias = result.end_index.i_word - 1
+                    bias = result.end_index.i_word - 1
+                concept_results.add(result.with_bias(bias))
+            results = concept_results
 
         return results
 
+    def iter_nodes(self):
+        """
+        深度优先遍历该概念下所有的 rule/filter/arg 节点
+        :return: 返回节点的迭代器
+        """
+        stack = list(self.rules_filters)
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(getattr(node, 'args', ()))
+
+    def find_dependencies(self):
+        """
+        查找该概念直接引用的所有概念
+        :return: 返回概念名称的集合
+        """
+        return set(node.name for node in self.iter_nodes() if isinstance(node, ConceptArg))
+
+    def find_ranges(self):
+        """
+        查找该概念的规则和过滤使用的范围 (去重), 用于计算长文档分窗口匹配的段落数目等
+        :return: 返回 (单位, 数目, 是否为过滤的范围) 的 frozenset, 过滤中数目为 0 的方向不包含在内
+        """
+        ret = set()
+        for node in self.iter_nodes():
+            if isinstance(node, RuleRangeArg):
+                ret.add((node.unit, node.n, False))
+            elif isinstance(node, FilterRangeArg):
+                for unit, n in ((node.forward_unit, node.forward_n), (node.backward_unit, node.backward_n)):
+                    if n > 0:
+                        ret.add((unit, n, True))
+        return frozenset(ret)
+
+    def find_triggers(self, concept_triggers):
+        """
+        计算命中该概念的必要关键词集合 (至少出现其中一个), 任一规则命中即可, 所以取并集.
+        概念过滤只会减少结果, 不影响该集合.
+        :param concept_triggers: 已经计算好的 concept_name => 必要关键词集合, 需包含所有依赖的概念
+        :return: 返回关键词集合, None 表示无法确定
+        """
+        ret = set()
+        for rule_or_filter in self.rules_filters:
+            if isinstance(rule_or_filter, ConceptFilter):
+                continue
+            triggers = rule_or_filter.find_triggers(concept_triggers)
+            if triggers is None:
+                return None
+            ret.update(triggers)
+        return frozenset(ret)
+
     def build(self):
         """
         通过提供的 syntax_parse_result 生成对应的 rule/filter/concept 对象队列, 属于某个 concept
@@ -99,7 +259,6 @@ class Concept(object):
                 concept_arg = ConceptArg(
                     self.config,
                     match_result.concept_name,
-                    self.concept_mgr,
                 )
                 return concept_arg
             elif match_result.syntax_type == SyntaxType.rule_range:
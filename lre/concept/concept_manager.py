@@ -4,10 +4,23 @@
 """
 from __future__ import unicode_literals
 
+from collections import Counter
+
+from ..arg import ConceptArg, FilterRangeArg, KeywordArg, RuleRangeArg
+from ..filter import ConceptFilter
+from ..plan import SharedPlans
+from ..rule import ArgRule
+from ..text import TextContext
+
+# 拓扑排序时节点的状态
+_VISITING = 1
+_VISITED = 2
+
 
 class ConceptManager(dict):
     """
-    概念管理器, 本质上是一个 dict, 可以用过 concept_name 得到 Concept 对象
+    概念管理器, 本质上是一个 dict, 可以用过 concept_name 得到 Concept 对象.
+    同时维护概念之间的依赖关系图 (DAG), 依据拓扑序进行匹配.
     """
 
     def __init__(self, config):
@@ -15,6 +28,24 @@ class ConceptManager(dict):
         :param config: 包含配置信息的对象
         """
         self.config = config
+        # 概念的拓扑序, 被依赖的概念在前. 为 None 表示需要重新生成
+        self.order = None
+        # 长文档分窗口匹配时窗口两侧需要额外包含的段落数目 (不考虑 @t 范围), 由 build 计算
+        self.para_margin = None
+        # 结果依赖 @t 范围 (直接使用或者引用了这样的概念) 的概念名称集合, 由 build 计算
+        self.text_scope_concepts = None
+        # 共享的子规则, 概念第一次匹配时使用它编译 (见 Concept.ensure_compiled), 由 build 计算
+        self.shared_plans = None
+        # 子规则的结构 => 出现次数, 用于 reload 时增量计算共享的子规则, 不会序列化
+        self.share_counts = None
+        # 共享子规则的统计信息, 见 share_nodes, 由 build 计算
+        self.share_stats = None
+
+    def __getstate__(self):
+        # 出现次数只在 reload 时使用, 需要时由概念重新统计, 不保存到模型文件中
+        state = self.__dict__.copy()
+        state['share_counts'] = None
+        return state
 
     def get(self, concept_name):
         """
@@ -30,21 +61,256 @@ class ConceptManager(dict):
         :param concept: 待添加的概念
         """
         self.__setitem__(concept.name, concept)
+        self.order = None
 
-    def match(self, text, filter_by_concept_name=lambda x: False):
+    def build(self, base=None):
         """
-        所有 concept 逐个 match
-        :param text: Text 对象
+        生成概念的依赖关系图并计算拓扑序, 同时检查:
+
+            1. 悬空引用, 即引用了不存在的概念 (一般是拼写错误)
+            2. 循环引用, 例如 A -> B -> A
+
+        不合法直接抛出异常. 之后依据拓扑序计算每个概念的必要关键词集合, 并且共享结构相同的子规则.
+        :param base: reload 时的旧 ConceptManager, 只重新统计新增/修改/删除的概念的子规则, 见 share_nodes
+        """
+        for concept_name in sorted(self.keys()):
+            for dep_name in sorted(self[concept_name].dependencies):
+                if dep_name not in self:
+                    raise ValueError('concept references an undefined concept', concept_name, dep_name)
+
+        # 非递归的深度优先遍历, 避免依赖链过长时栈溢出
+        order = []
+        state = {}
+        for root_name in sorted(self.keys()):
+            if root_name in state:
+                continue
+
+            state[root_name] = _VISITING
+            stack = [(root_name, iter(sorted(self[root_name].dependencies)))]
+            while stack:
+                concept_name, dep_iter = stack[-1]
+                for dep_name in dep_iter:
+                    dep_state = state.get(dep_name)
+                    if dep_state is None:  # 未访问, 先处理依赖
+                        state[dep_name] = _VISITING
+                        stack.append((dep_name, iter(sorted(self[dep_name].dependencies))))
+                        break
+                    elif dep_state == _VISITING:  # 依赖还在栈中, 说明存在环
+                        path = [x[0] for x in stack]
+                        cycle = path[path.index(dep_name):] + [dep_name]
+                        raise ValueError('concept reference cycle', ' -> '.join(cycle))
+                else:  # 所有依赖都已处理
+                    stack.pop()
+                    state[concept_name] = _VISITED
+                    order.append(concept_name)
+
+        self.order = order
+
+        # 被依赖的概念在前, 保证计算时依赖的集合已经存在
+        concept_triggers = {}
+        for concept_name in order:
+            concept = self[concept_name]
+            concept.triggers = concept.find_triggers(concept_triggers)
+            concept_triggers[concept_name] = concept.triggers
+
+        self.para_margin = self.find_para_margin()
+        self.text_scope_concepts = self.find_text_scope_concepts()
+        self.share_stats = self.share_nodes(base)
+
+    @staticmethod
+    def shareable(node):
+        """
+        节点是否值得共享. 只做转发的 ArgRule, 单个关键词 (直接查找 word_map), 概念引用 (已经缓存) 和范围参数不需要共享
+        :param node: rule/filter/arg 节点
+        :return: 返回是否值得共享
+        """
+        if isinstance(node, (ArgRule, ConceptArg, ConceptFilter, RuleRangeArg, FilterRangeArg)):
+            return False
+        if isinstance(node, KeywordArg):
+            return len(node.words) > 1
+        return True
+
+    @classmethod
+    def count_nodes(cls, concepts):
+        """
+        统计若干概念中值得共享的子规则的结构出现的次数
+        :param concepts: Concept 对象的可迭代对象
+        :return: 返回 {结构: 出现次数} 的 Counter
+        """
+        counts = Counter()
+        for concept in concepts:
+            for node in concept.iter_nodes():
+                if cls.shareable(node):
+                    counts[node.structure()] += 1
+        return counts
+
+    def share_nodes(self, base=None):
+        """
+        查找在多处 (同一概念或不同概念) 出现的结构相同的子规则, 例如各个概念中重复出现的否定词列表,
+        使这些子规则只编译一次, 每篇文档中只计算一次, 结果由所有引用它的规则共用.
+
+        不会编译任何概念, 概念在第一次匹配时使用 shared_plans 编译. 新的 shared_plans 保留仍然共享的子规则的编号和
+        匹配函数, 丢弃不再共享的, 编号不会重复使用, 所以已经编译好的概念可以继续使用. reload 时 (base 不为 None) 与旧概念 rules_filters 相同的概念直接复用,
+        只统计新增/修改/删除的概念 (加载的模型没有保存出现次数, 第一次 reload 时会统计一次所有概念).
+        :param base: reload 时的旧 ConceptManager, None 表示统计所有概念
+        :return: 返回统计信息 dict:
+                     * nodes: 值得共享的节点数目
+                     * shared: 在多处出现的子规则数目 (去重后)
+                     * deduplicated: 去重的节点数目, 即不再单独计算的节点数目
+        """
+        if base is None or base.shared_plans is None:
+            counts = self.count_nodes(self.values())
+            shared_plans = self.shared_plans or SharedPlans()
+        else:
+            def reused(concept_name):
+                return concept_name in self and concept_name in base \
+                    and self[concept_name].rules_filters is base[concept_name].rules_filters
+
+            # 加载的模型没有保存出现次数, 第一次 reload 时统计一次
+            counts = Counter(base.share_counts or self.count_nodes(base.values()))
+            counts.subtract(self.count_nodes(x for name, x in base.items() if not reused(name)))
+            counts.update(self.count_nodes(x for name, x in self.items() if not reused(name)))
+            counts = +counts
+            shared_plans = base.shared_plans
+
+        keys = [key for key, count in counts.items() if count > 1]
+        self.shared_plans = shared_plans.update(keys)
+        self.share_counts = counts
+
+        return {
+            'nodes': sum(counts.values()),
+            'shared': len(keys),
+            'deduplicated': sum(counts[key] - 1 for key in keys),
+        }
+
+    def compile(self):
+        """
+        编译所有还没有编译的概念, 避免第一次匹配时的延迟, 见 Model.warmup
+        """
+        if self.order is None:
+            self.build()
+        for concept_name in self.order:
+            self[concept_name].ensure_compiled()
+
+    def find_para_margin(self):
+        """
+        计算长文档分窗口匹配时, 窗口两侧需要额外包含的段落数目 m. 保证起始于窗口中间部分的结果与整篇匹配时一致:
+
+            * 规则的结果最多跨越 P 个段落 (@pP, 其他范围不跨段落)
+            * 过滤会查看结果前后 K 个段落 (@[pK, ...]) 中的过滤结果, 过滤结果本身也最多跨越 P 个段落
+            * 每一层概念引用都可能再扩大一次上述范围, 层数为依赖链的最大长度 D
+
+        所以 m = D * (P - 1 + K). 只使用 d/w/s 范围的规则不需要额外的段落.
+        @t 范围无法在窗口内确定, 不参与计算, 依赖它的概念见 find_text_scope_concepts.
+        :return: 返回段落数目
+        """
+        max_rule_paras = 1
+        max_filter_paras = 0
+        for concept in self.values():
+            for unit, n, is_filter in concept.ranges:
+                if unit != 'p':
+                    continue
+                elif is_filter:
+                    max_filter_paras = max(max_filter_paras, n)
+                else:
+                    max_rule_paras = max(max_rule_paras, n)
+
+        # 被依赖的概念在前, 深度为依赖链的长度
+        depth = {}
+        for concept_name in self.order:
+            dependencies = self[concept_name].dependencies
+            depth[concept_name] = 1 + max([depth[x] for x in dependencies] or [0])
+        max_depth = max(depth.values() or [0])
+
+        return max_depth * (max_rule_paras - 1 + max_filter_paras)
+
+    def find_text_scope_concepts(self):
+        """
+        找出结果依赖 @t 范围的概念, 即规则或过滤中使用了 @t, 或者引用了这样的概念.
+        这些概念的结果可能受文档任意位置的影响, 只能在整篇文档上匹配
+        :return: 返回概念名称的 frozenset
+        """
+        ret = set()
+        # 被依赖的概念在前
+        for concept_name in self.order:
+            concept = self[concept_name]
+            if any(x in ret for x in concept.dependencies) or \
+                    any(unit == 't' for unit, n, is_filter in concept.ranges):
+                ret.add(concept_name)
+        return frozenset(ret)
+
+    def closure(self, concept_names):
+        """
+        计算若干概念的依赖闭包 (包含其自身)
+        :param concept_names: 概念名称的列表
+        :return: 返回闭包中概念名称的集合
+        """
+        ret = set()
+        stack = list(concept_names)
+        while stack:
+            concept_name = stack.pop()
+            if concept_name not in ret:
+                ret.add(concept_name)
+                stack.extend(self[concept_name].dependencies)
+        return ret
+
+    def match(self, text, filter_by_concept_name=lambda x: False, stats=None, limit=None, any_hit=False):
+        """
+        依据拓扑序逐个 match, 被依赖的概念先计算, 后续引用直接使用缓存.
+        只需要部分结果 (limit) 时直接匹配请求的概念, 依赖的概念在被引用时才计算
+        :param text: Text 对象, 同一个 Text 中每个 concept 只会计算一次 (被引用的 concept 会缓存)
         :param filter_by_concept_name: 用于过滤部分不需要运行的 concept
                                        实际上是一个函数, 输入为 concept_name,
                                        输出为是否要运行, 默认为所有都运行
                                        (即: 所有都返回 False)
+                                       只会计算未过滤的 concept 及其依赖
+        :param stats: 用于收集统计信息的 dict, 不为 None 时会写入:
+                          * evaluated: 运行了规则的 concept 数目
+                          * pruned: 因为不包含必要关键词而跳过的 concept 数目
+        :param limit: 每个概念需要的结果数目, 得到足够的结果即可停止, None 表示需要全部结果
+        :param any_hit: 为 True 时每个概念任意 limit 个结果即可, 否则为最早的 limit 个, 见 TextContext
         :return: 返回命中有结果 {concept_name: Results} dict
         """
+        if self.order is None:
+            self.build()
+        if limit is not None and limit < 1:
+            raise ValueError('limit should be positive', limit)
+
+        requested = [x for x in self.order if not filter_by_concept_name(x)]
+        if limit is not None or len(requested) == len(self.order):
+            closure = None
+        else:
+            closure = self.closure(requested)
+
+        context = TextContext(text, self, any_hit)
+        if limit is None:
+            for concept_name in self.order:
+                if closure is None or concept_name in closure:
+                    context.match_concept(concept_name)
+
         ret = {}
-        for concept_name, concept in self.items():
-            if not filter_by_concept_name(concept_name):
-                results = concept.match(text)
-                if len(results) > 0:
-                    ret[concept_name] = results
+        for concept_name in requested:
+            results = context.match_concept(concept_name, limit)
+            if len(results) > 0:
+                ret[concept_name] = results
+
+        if stats is not None:
+            stats['evaluated'] = context.evaluated_count
+            stats['pruned'] = context.pruned_count
         return ret
+
+    def any_match(self, text, concept_names):
+        """
+        判断是否有任一概念命中, 每个概念在第一个结果处停止, 命中一个即返回
+        :param text: Text 对象
+        :param concept_names: 概念名称的列表, 按顺序判断
+        :return: 返回第一个命中的概念名称, 都没有命中返回 None
+        """
+        if self.order is None:
+            self.build()
+
+        context = TextContext(text, self, any_hit=True)
+        for concept_name in concept_names:
+            if len(context.match_concept(concept_name, 1)) > 0:
+                return concept_name
+        return None
@@ -13,6 +13,9 @@ class Config(object):
     配置参数
     """
 
+    # 会影响规则编译结果的字段, 保存的模型只能在这些字段一致的配置下加载
+    compiled_fields = ('word_level', 'language', 'force_concept_size_one', 'fast_char_cut')
+
     def __init__(self, **kwargs):
         # 默认 char，字符级别
         self.word_level = kwargs.get('word_level', 'char')
@@ -22,3 +25,26 @@ class Config(object):
         self.language = kwargs.get('language', 'zh')
         # 强制 concept 命中后的结果长度设置为 1, 默认为 True
         self.force_concept_size_one = kwargs.get('force_concept_size_one', True)
+        # 字符级别时不使用 jieba 而是直接按字符类型切分, 默认为 False.
+        # 与 jieba 的结果在少数情况下不同 (见 NlpZh.sent2char), 开启前需要确认规则不受影响
+        self.fast_char_cut = kwargs.get('fast_char_cut', False)
+        # 文档结果缓存的容量, 以缓存的 Result 数目计 (每篇文档额外算 1), 默认为 0 即不缓存
+        self.result_cache_size = kwargs.get('result_cache_size', 0)
+        # 文档结果缓存的有效时间 (秒), 默认为 None 即不过期
+        self.result_cache_ttl = kwargs.get('result_cache_ttl', None)
+        # 句子切分结果缓存的容量 (句子数目), 同一配置的所有 Text 共享, 默认为 0 即不缓存
+        self.sent_cache_size = kwargs.get('sent_cache_size', 0)
+
+    def to_dict(self):
+        """
+        返回所有字段的 dict, 可以通过 Config(**config.to_dict()) 还原
+        """
+        return dict(self.__dict__)
+
+    def incompatible_fields(self, other):
+        """
+        找出与另一个配置不一致的编译相关字段
+        :param other: 另一个 Config 对象
+        :return: 返回不一致的字段名称列表
+        """
+        return [x for x in self.compiled_fields if getattr(self, x) != getattr(other, x)]
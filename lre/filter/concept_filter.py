@@ -6,6 +6,8 @@ from __future__ import unicode_literals
 
 import six
 
+from ..arg.filter_range_arg import FilterIndex
+from ..plan import compile_node
 from ..result import Results
 
 
@@ -60,21 +62,32 @@ class ConceptFilter(object):
                 ', '.join(self.__class__.supported_arg_names)
             ), arg_name)
 
+    def compile(self, shared=None):
+        """
+        编译成过滤函数, 对已经匹配的结果进行限制过滤, 滤除不合规范的结果
+        :param shared: 共享子规则的 SharedPlans 对象, 见 lre.plan, None 表示不共享
+        :return: 返回 filter_target(text, target_results) 函数
+        """
+        filter_range = self.args[0]
+        filter_match = compile_node(self.args[1], shared)
+
+        def filter_target(text, target_results):
+            # 过滤结果只需要建立一次索引
+            filter_results = FilterIndex(filter_match(text))
+            ret_results = Results()
+            for target_result in target_results:
+                # 没有被过滤则加进去
+                if not filter_range.filter(target_result, filter_results):
+                    ret_results.add(target_result)
+            return ret_results
+
+        return filter_target
+
     def filter(self, text, target_results):
         """
-        对已经匹配的结果进行限制过滤, 滤除不合规范的结果
+        对已经匹配的结果进行限制过滤, 滤除不合规范的结果. 每次调用都会重新编译, 见 compile
         :param text: 原文 Text 对象
         :param target_results: 目标结果, Concept 的所有结果
         :return: 返回滤除后的合规范结果
         """
-        filter_range = self.args[0]
-        filter_rule = self.args[1]
-
-        filter_results = filter_rule.match(text)
-        ret_results = Results()
-        for target_result in target_results:
-            # 没有被过滤则加进去
-            if not filter_range.filter(target_result, filter_results):
-                ret_results.add(target_result)
-
-        return ret_results
+        return self.compile()(text, target_results)
@@ -6,6 +6,8 @@ from __future__ import unicode_literals
 
 import six
 
+from ..arg.filter_range_arg import FilterIndex
+from ..plan import compile_node
 from ..result import Results
 
 
@@ -77,28 +79,87 @@ class RuleFilter(object):
                 ), index, arg_name)
             index += 1
 
-    def match(self, text):
+    def find_triggers(self, concept_triggers):
         """
-        对已经匹配的结果进行限制过滤, 滤除不合规范的结果
-        :param text: 原文 Text 对象
-        :return: 返回滤除后的合规范结果
+        计算命中该过滤器的必要关键词集合 (至少出现其中一个), 即目标规则的必要关键词集合
+        :param concept_triggers: 已经计算好的 concept_name => 必要关键词集合
+        :return: 返回关键词集合, None 表示无法确定
+        """
+        return self.args[0].find_triggers(concept_triggers)
+
+    def structure(self):
         """
-        target_rule = self.args[0]
+        用于判断子规则是否相同的结构: 目标规则和所有过滤范围/过滤规则的结构
+        :return: 返回 tuple
+        """
+        return ('RuleFilter',) + tuple(arg.structure() for arg in self.args)
 
-        filter_results_list = []
+    def compile(self, shared=None):
+        """
+        编译成匹配函数, 对目标规则的结果进行限制过滤, 滤除不合规范的结果.
+        limit 不为 None 时只过滤目标规则最早的 target_limit 个结果, 过滤后仍然是全部结果中最早的部分.
+        target_limit 从 limit 开始逐步增加 (每次 4 倍), 直到过滤后的结果足够或者已经过滤了目标规则的全部结果
+        :param shared: 共享子规则的 SharedPlans 对象, 见 lre.plan, None 表示不共享
+        :return: 返回 match(text, limit=None) 函数
+        """
+        target_match = compile_node(self.args[0], shared)
         # 一个 range 一个 rule, 按顺序成对出现
-        for filter_range, filter_rule in zip(self.args[1::2], self.args[2::2]):
-            filter_results_list.append((filter_range, filter_rule.match(text)))
+        filters = [(filter_range, compile_node(filter_rule, shared))
+                   for filter_range, filter_rule in zip(self.args[1::2], self.args[2::2])]
+        filter_results = self.filter_results
+
+        def match(text, limit=None):
+            # 过滤结果在第一次用到时才匹配, 只需要建立一次索引
+            filter_indexes = [None] * len(filters)
+
+            if limit is None:
+                return filter_results(text, target_match(text), filters, filter_indexes, None)
+
+            target_limit = limit
+            while True:
+                target_results = target_match(text, target_limit)
+                # 目标结果少于 target_limit 说明已经是全部结果
+                complete = len(target_results) < target_limit
+                ret_results = filter_results(
+                    text, target_results.head(target_limit), filters, filter_indexes, limit)
+                if len(ret_results) >= limit or complete:
+                    return ret_results
+                target_limit *= 4
+
+        return match
+
+    def match(self, text, limit=None):
+        """
+        对已经匹配的结果进行限制过滤, 滤除不合规范的结果. 每次调用都会重新编译, 见 compile
+        :param text: 原文 Text 对象
+        :param limit: 需要的结果数目, 见 TextContext.match_concept
+        :return: 返回滤除后的合规范结果
+        """
+        return self.compile()(text, limit)
 
-        target_results = target_rule.match(text)
+    @staticmethod
+    def filter_results(text, target_results, filters, filter_indexes, limit):
+        """
+        逐个过滤目标结果
+        :param text: 原文 Text 对象
+        :param target_results: 目标规则的结果
+        :param filters: (FilterRangeArg 对象, 过滤规则的匹配函数) 的列表
+        :param filter_indexes: 每个过滤规则的 FilterIndex 对象, 为 None 时匹配并建立索引
+        :param limit: 需要的结果数目, 得到足够的结果即停止过滤, None 表示需要全部结果
+        :return: 返回滤除后的合规范结果
+        """
         ret_results = Results()
         for target_result in target_results:
             # 逐个 filter 规则过滤
-            for filter_range, filter_results in filter_results_list:
+            for i, (filter_range, filter_match) in enumerate(filters):
+                if filter_indexes[i] is None:
+                    filter_indexes[i] = FilterIndex(filter_match(text))
                 # 某条规则命中, 过滤, 其他规则可以不用考虑了
-                if filter_range.filter(target_result, filter_results):
+                if filter_range.filter(target_result, filter_indexes[i]):
                     break
             else:  # 没有被过滤则加进去
                 ret_results.add(target_result)
+                if limit is not None and len(ret_results) >= limit:
+                    break
 
         return ret_results
@@ -4,65 +4,351 @@
 """
 from __future__ import unicode_literals
 
+import copy
+import gc
+import hashlib
+import multiprocessing
 import os
-from warnings import warn
 
 import six
+from six.moves import cPickle as pickle
 
+from .cache import LRUCache
+from .config import Config
 from .concept import Concept, ConceptManager
+from .nlp import Nlp
+from .result import Results
 from .syntax import SyntaxParser
-from .text import Text
+from .text import Text, TextView
 
 if six.PY2:
     from codecs import open
 
+# 模型文件的标识以及格式版本号, 格式不兼容时需要升级版本号
+MODEL_FILE_MAGIC = b'LRE-MODEL'
+MODEL_FORMAT_VERSION = 1
+
+# 子进程中解析规则文件使用的语法分析器, 由 _init_parse_worker 设置
+_worker_syntax_parser = None
+
+
+def _init_parse_worker(config):
+    """
+    解析规则文件的进程初始化, 每个进程只生成一个语法分析器
+    :param config: 存储配置信息的对象
+    """
+    global _worker_syntax_parser
+    _worker_syntax_parser = SyntaxParser(config)
+
+
+def _read_rule_file(file_path):
+    """
+    读取一个规则文件
+    :param file_path: 规则文件路径
+    :return: 返回 (内容的 sha1, 文件内容字符串)
+    """
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    return hashlib.sha1(data).hexdigest(), data.decode('utf-8')
+
+
+def _parse_rule_text(syntax_parser, file_path, text):
+    """
+    解析规则文件的内容
+    :param syntax_parser: 语法分析器
+    :param file_path: 规则文件路径, 用于报错
+    :param text: 规则文件内容
+    :return: 返回 SyntaxParseResult 对象, 出错时抛出的 ValueError 的第 1 个参数为文件路径
+    """
+    try:
+        return syntax_parser.parse(text)
+    except ValueError as e:
+        raise ValueError(*((file_path,) + e.args))
+
+
+def _parse_worker(file_path):
+    """
+    读取并解析一个规则文件, 内容的 sha1 和解析结果来自同一次读取
+    :param file_path: 规则文件路径
+    :return: 返回 (内容的 sha1, SyntaxParseResult 对象)
+    """
+    digest, text = _read_rule_file(file_path)
+    return digest, _parse_rule_text(_worker_syntax_parser, file_path, text)
+
+
+# 子进程中使用的模型和概念过滤函数, 由 _init_match_worker 设置
+_worker_model = None
+_worker_filter = None
+
+
+def _init_match_worker(model, filter_by_concept_name):
+    """
+    子进程的初始化, 每个子进程只接收一次模型
+    :param model: 训练好的模型对象
+    :param filter_by_concept_name: 用于过滤部分不需要运行的 concept, None 表示都运行
+    """
+    global _worker_model, _worker_filter
+    _worker_model = model
+    _worker_filter = filter_by_concept_name
+
+
+def _match_worker(item):
+    """
+    子进程中匹配一个文档
+    :param item: (doc_id, 文档字符串)
+    :return: 返回 (doc_id, {concept_name: Results})
+    """
+    doc_id, text = item
+    if _worker_filter is None:
+        return doc_id, _worker_model.match(text)
+    else:
+        return doc_id, _worker_model.match(text, _worker_filter)
+
 
 class Model(object):
     """
     模型, 作为一个整体进行操作, 可以理解为所有规则的入口对象.
     """
 
-    @classmethod
-    def train(cls, config, rule_dir_path):
+    # match 支持的结果模式
+    match_modes = ('all', 'exists', 'top')
+
+    @staticmethod
+    def find_rule_files(rule_dir_path):
         """
-        处理规则文件夹, 生成模型对象
-        :param config: 存储配置信息的对象
+        查找规则目录下的所有规则文件, 只接受 XXXX.cpt 这样的命名方式, XXXX 为概念名称
         :param rule_dir_path: 规则目录路径
-        :return: 返回模型对象
+        :return: 返回按路径排序的 [(concept_name, file_path), ...]
         """
         if not os.path.exists(rule_dir_path):
             raise ValueError('rule_dir_path does not exist', rule_dir_path)
         if not os.path.isdir(rule_dir_path):
             raise ValueError('rule_dir_path is not a dir', rule_dir_path)
 
-        # 目录下的所有文件
-        concept_mgr = ConceptManager(config)
-        syntax_parser = SyntaxParser(config)
+        rule_files = []
         for root, dirs, files in os.walk(rule_dir_path):
             for file_name in files:
-                file_path = os.path.join(root, file_name)
-                concept_name, suffix = file_name.rsplit('.', 1)
-                if suffix != 'cpt':  # 只接受 XXXX.cpt 这样的命名方式
+                concept_name, suffix = os.path.splitext(file_name)
+                if suffix != '.cpt':
                     continue
+                rule_files.append((concept_name, os.path.join(root, file_name)))
+        # 排序保证多进程编译以及不同机器上的结果一致
+        rule_files.sort(key=lambda x: x[1])
+        return rule_files
+
+    @classmethod
+    def train(cls, config, rule_dir_path, workers=1, chunksize=16):
+        """
+        处理规则文件夹, 生成模型对象
+        :param config: 存储配置信息的对象
+        :param rule_dir_path: 规则目录路径
+        :param workers: 解析规则文件的进程数, 默认为 1 即在当前进程中解析, None 表示使用 CPU 核数
+        :param chunksize: 每次分发给子进程的规则文件数目
+        :return: 返回模型对象
+        """
+        rule_files = cls.find_rule_files(rule_dir_path)
+        file_paths = [x[1] for x in rule_files]
+
+        # 解析规则文件 (包括关键词的分词) 是最耗时的部分, 可以多进程完成
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if workers <= 1:
+            # 当前进程中使用局部的语法分析器, 不修改子进程使用的全局变量
+            syntax_parser = SyntaxParser(config)
+            parsed = []
+            for file_path in file_paths:
+                digest, text = _read_rule_file(file_path)
+                parsed.append((digest, _parse_rule_text(syntax_parser, file_path, text)))
+        else:
+            pool = multiprocessing.Pool(workers, _init_parse_worker, (config,))
+            try:
+                parsed = pool.map(_parse_worker, file_paths, chunksize)
+            finally:
+                pool.terminate()
+                pool.join()
 
-                with open(file_path, encoding='utf-8') as f:
-                    try:
-                        text = f.read()
-                        syntax_parse_result = syntax_parser.parse(text)
-                        concept = Concept(config, concept_name, concept_mgr, syntax_parse_result)
-                        concept_mgr.add(concept)
-                    except Exception as e:
-                        warn(six.text_type(e))
-                        warn(file_path)
-                        raise e
+        # 按照文件顺序生成概念, 同名的概念后者覆盖前者
+        concept_mgr = ConceptManager(config)
+        rule_digests = {}
+        for (concept_name, file_path), (digest, syntax_parse_result) in zip(rule_files, parsed):
+            concept_mgr.add(cls.build_concept(config, concept_name, file_path, concept_mgr, syntax_parse_result))
+            rule_digests[concept_name] = (file_path, digest)
+
+        # 检查概念之间的引用关系 (悬空引用/循环引用) 并生成拓扑序
+        concept_mgr.build()
 
-        return cls(concept_mgr, config)
+        return cls(concept_mgr, config, rule_digests)
 
-    def __init__(self, concept_mgr, config):
+    @staticmethod
+    def build_concept(config, concept_name, file_path, concept_mgr, syntax_parse_result):
+        """
+        由解析结果生成概念, 出错时抛出的 ValueError 的第 1 个参数为文件路径
+        :param config: 存储配置信息的对象
+        :param concept_name: 概念名称
+        :param file_path: 规则文件路径
+        :param concept_mgr: 概念所属的 manager
+        :param syntax_parse_result: 规则文件的解析结果
+        :return: 返回 Concept 对象
+        """
+        try:
+            return Concept(config, concept_name, concept_mgr, syntax_parse_result)
+        except ValueError as e:
+            raise ValueError(*((file_path,) + e.args))
+
+    def __init__(self, concept_mgr, config, rule_digests=None):
+        """
+        :param concept_mgr: 用来存储管理 concept_name => Concept 的对象
+        :param config: 存储配置信息的对象
+        :param rule_digests: {concept_name: (规则文件路径, 内容的 sha1)}, 用于 reload 判断哪些规则文件有修改
+        """
         self.concept_mgr = concept_mgr
         self.config = config
+        self.rule_digests = rule_digests or {}
+        # 每次 reload 替换概念图之后加 1
+        self.version = 0
+        # 文档字符串 => 匹配结果的缓存, 未开启时为 None
+        self.result_cache = self.create_result_cache(config)
 
-    def match(self, text, filter_by_concept_name=lambda x: False):
+    @staticmethod
+    def create_result_cache(config):
+        """
+        依据配置生成文档结果缓存, 每个条目的权重为其中 Result 的数目加 1
+        :param config: 存储配置信息的对象
+        :return: 返回 LRUCache 对象, 未开启缓存时返回 None
+        """
+        if not config.result_cache_size:
+            return None
+        return LRUCache(
+            config.result_cache_size,
+            config.result_cache_ttl,
+            lambda concept_results: 1 + sum(len(x) for x in concept_results.values()),
+        )
+
+    def __getstate__(self):
+        # 缓存 (包含锁) 不需要序列化, 例如 match_many 传给子进程时
+        state = dict(self.__dict__)
+        state['result_cache'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.result_cache = self.create_result_cache(self.config)
+
+    def warmup(self):
+        """
+        预先加载分词词典, 生成概念的拓扑序并编译所有概念, 避免第一次 match 时的延迟. 一般在服务启动完成之前调用
+        """
+        Nlp.get(self.config).warmup()
+        self.concept_mgr.compile()
+
+    def reload(self, rule_dir_path):
+        """
+        增量加载规则目录, 只重新解析内容 (sha1) 有变化的规则文件.
+        没有变化的概念直接复用已经编译好的规则, 新增/修改/删除的概念及依赖它们的概念会重新检查引用并计算必要关键词.
+
+        新的概念图完整生成并通过检查后才会替换 (一次赋值), 正在进行的 match 会继续使用旧的概念图;
+        出错时模型保持不变. 多个 reload 不能并发调用.
+        :param rule_dir_path: 规则目录路径
+        :return: 返回 {'added': [...], 'changed': [...], 'removed': [...]}, 均为概念名称的列表
+        """
+        old_mgr = self.concept_mgr
+        old_digests = self.rule_digests
+
+        # 只读取文件计算 sha1, 不需要解析
+        rule_texts = {}
+        rule_digests = {}
+        for concept_name, file_path in self.find_rule_files(rule_dir_path):
+            digest, text = _read_rule_file(file_path)
+            rule_texts[concept_name] = text
+            rule_digests[concept_name] = (file_path, digest)
+
+        added = sorted(x for x in rule_digests if x not in old_digests)
+        changed = sorted(x for x in rule_digests if x in old_digests and rule_digests[x] != old_digests[x])
+        removed = sorted(x for x in old_digests if x not in rule_digests)
+        ret = {'added': added, 'changed': changed, 'removed': removed}
+        if not added and not changed and not removed:
+            return ret
+
+        dirty = set(added) | set(changed)
+        concept_mgr = ConceptManager(self.config)
+        syntax_parser = None
+        for concept_name in sorted(rule_digests):
+            file_path = rule_digests[concept_name][0]
+            if concept_name in dirty:
+                if syntax_parser is None:
+                    syntax_parser = SyntaxParser(self.config)
+                syntax_parse_result = _parse_rule_text(syntax_parser, file_path, rule_texts[concept_name])
+                concept = self.build_concept(self.config, concept_name, file_path, concept_mgr, syntax_parse_result)
+            else:
+                # 编译好的规则只通过名称引用其他概念, 可以共享; 复制一份以免修改旧概念图中的 manager 和必要关键词
+                concept = copy.copy(old_mgr.get(concept_name))
+                concept.concept_mgr = concept_mgr
+            concept_mgr.add(concept)
+
+        # 依赖已删除概念的规则会在这里报错, 此时还没有替换. 只重新统计有变化的概念的子规则
+        concept_mgr.build(old_mgr)
+
+        self.concept_mgr = concept_mgr
+        self.rule_digests = rule_digests
+        self.version += 1
+        # 旧版本的结果不会再命中 (key 包含版本号), 直接释放
+        if self.result_cache is not None:
+            self.result_cache.clear()
+        return ret
+
+    def save(self, path):
+        """
+        保存编译好的模型 (概念和规则对象, 以及分好词的关键词), 加载时不需要再解析规则文件.
+        文件格式为: 标识 + 头部 (格式版本号, 配置) + 概念管理器, 后两者使用 pickle 序列化
+        :param path: 模型文件的路径
+        """
+        header = {
+            'version': MODEL_FORMAT_VERSION,
+            'config': self.config.to_dict(),
+            'rule_digests': self.rule_digests,
+        }
+        with open(path, 'wb') as f:
+            f.write(MODEL_FILE_MAGIC)
+            pickle.dump(header, f, 2)
+            pickle.dump(self.concept_mgr, f, 2)
+
+    @classmethod
+    def load(cls, path, config=None):
+        """
+        加载 save 保存的模型. 模型文件使用 pickle 序列化, 只能加载可信的文件
+        :param path: 模型文件的路径
+        :param config: 存储配置信息的对象, 默认使用模型保存时的配置.
+                       与保存时的配置中会影响编译结果的字段 (Config.compiled_fields) 不一致时报错
+        :return: 返回模型对象
+        """
+        with open(path, 'rb') as f:
+            if f.read(len(MODEL_FILE_MAGIC)) != MODEL_FILE_MAGIC:
+                raise ValueError('invalid model file', path)
+
+            header = pickle.load(f)
+            if header['version'] != MODEL_FORMAT_VERSION:
+                raise ValueError('unsupported model format version', header['version'], MODEL_FORMAT_VERSION)
+
+            saved_config = Config(**header['config'])
+            if config is None:
+                config = saved_config
+            else:
+                fields = saved_config.incompatible_fields(config)
+                if fields:
+                    raise ValueError('model was built with an incompatible config', fields)
+
+            # 反序列化会生成大量长期存在的规则对象, 期间不断触发的垃圾回收占用大部分时间却回收不到对象, 暂时关闭
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                concept_mgr = pickle.load(f)
+            finally:
+                if gc_enabled:
+                    gc.enable()
+
+        return cls(concept_mgr, config, header.get('rule_digests'))
+
+    def match(self, text, filter_by_concept_name=lambda x: False, stats=None, mode='all', top_k=None):
         """
         匹配, 模型会对每个 concept 进行一次匹配
         :param text: 输入的文档字符串
@@ -70,12 +356,238 @@ class Model(object):
                                        实际上是一个函数, 输入为 concept_name,
                                        输出为是否要运行, 默认为所有都运行
                                        (即: 所有都返回 False)
-        :return: 返回 {concept_name: Results} 的 dict
+        :param stats: 用于收集统计信息的 dict, 例如跳过的 concept 数目 (pruned), 见 ConceptManager.match.
+                      开启了结果缓存时还会写入 cached: 是否命中缓存 (命中时没有其他统计信息)
+        :param mode: 结果模式:
+                         * all: 全部结果
+                         * exists: 只判断是否命中, $or 的分支和概念的规则按顺序匹配, 在第一个命中处停止,
+                                   命中的概念只返回一个结果 (不一定是最早的)
+                         * top: 每个概念只返回最早 (按起始 offset 排序) 的 top_k 个结果. $or 的分支和直接引用的概念
+                                只计算最早的部分结果, 连接规则按起始位置逐步连接, 得到足够的结果即停止.
+                                只有返回的 Results 和连接过程中的部分结果受 top_k 限制, 连接规则的各个参数
+                                (包括其中引用的概念) 以及带概念过滤的概念仍然计算全部结果
+                     只需要结果数目时使用 all 模式结果的 len(), 计算数目同样需要生成全部结果
+        :param top_k: top 模式下每个概念的结果数目
+        :return: 返回 {concept_name: Results} 的 dict, 开启了结果缓存时 Results 可能是共享的, 不可修改
         """
+        if mode not in self.match_modes:
+            raise ValueError('invalid mode', mode)
+        if mode == 'top' and (top_k is None or top_k < 1):
+            raise ValueError('top_k should be positive', top_k)
+
+        # 先取版本号再取概念图, reload 同时进行时最多把新结果存到旧版本号下, 不会把旧结果存到新版本号下
+        version = self.version
+        concept_mgr = self.concept_mgr
+
+        cache_key = None
         if isinstance(text, six.text_type):
+            if self.result_cache is not None:
+                cache_key = (
+                    hashlib.sha1(text.encode('utf-8')).digest(),
+                    frozenset(x for x in concept_mgr if not filter_by_concept_name(x)),
+                    version,
+                    mode,
+                    top_k if mode == 'top' else None,
+                )
+                concept_results = self.result_cache.get(cache_key)
+                if stats is not None:
+                    stats['cached'] = concept_results is not None
+                if concept_results is not None:
+                    return dict(concept_results)
             text = Text(self.config, text)
         elif not isinstance(text, Text):
             raise ValueError('invalid text type')
 
-        concept_results = self.concept_mgr.match(text, filter_by_concept_name)
+        if mode in ('exists', 'top'):
+            limit = 1 if mode == 'exists' else top_k
+            concept_results = concept_mgr.match(text, filter_by_concept_name, stats, limit, mode == 'exists')
+            for concept_name, results in concept_results.items():
+                concept_results[concept_name] = results.head(limit)
+        else:
+            concept_results = concept_mgr.match(text, filter_by_concept_name, stats)
+
+        if cache_key is not None:
+            self.result_cache.put(cache_key, concept_results)
+            concept_results = dict(concept_results)
         return concept_results
+
+    def any_match(self, text, concept_names=None):
+        """
+        判断是否有任一概念命中, 每个概念在第一个结果处停止, 命中一个即返回. 用于只关心是否命中的场景 (例如打标签)
+        :param text: 输入的文档字符串或者 Text 对象
+        :param concept_names: 概念名称的列表, 按顺序判断, 默认为所有概念 (按拓扑序)
+        :return: 返回第一个命中的概念名称, 都没有命中返回 None
+        """
+        if isinstance(text, six.text_type):
+            text = Text(self.config, text)
+        elif not isinstance(text, Text):
+            raise ValueError('invalid text type')
+
+        concept_mgr = self.concept_mgr
+        if concept_names is None:
+            if concept_mgr.order is None:
+                concept_mgr.build()
+            concept_names = concept_mgr.order
+        return concept_mgr.any_match(text, concept_names)
+
+    def match_append(self, text, concept_results, para_beg, filter_by_concept_name=lambda x: False):
+        """
+        增量匹配, 用于 Text.append 之后只更新受影响的结果. 起始于 para_beg 之前 para_margin 个段落以前的结果不受新段落影响,
+        保持不变; 之后的结果在 Text 的末尾部分 (再往前 para_margin 个段落) 上重新匹配. 代价与文档已有的长度无关.
+
+            text = Text(config, first_paragraph)
+            concept_results = model.match(text)
+            for paragraph in stream:
+                para_beg = text.append(paragraph)
+                model.match_append(text, concept_results, para_beg)
+
+        需要计算的概念中有依赖 @t 范围的概念 (见 ConceptManager.text_scope_concepts) 时重新匹配整篇文档.
+        :param text: 追加过段落的 Text 对象
+        :param concept_results: 追加之前的 {concept_name: Results}, 会被原地更新
+        :param para_beg: 第一个追加的段落的序号, 即 Text.append 的返回值
+        :param filter_by_concept_name: 用于过滤部分不需要运行的 concept, 见 match, 应与之前匹配时一致
+        :return: 返回更新后的 concept_results
+        """
+        concept_mgr = self.concept_mgr
+        if concept_mgr.order is None:
+            concept_mgr.build()
+        margin = concept_mgr.para_margin
+
+        if any(not filter_by_concept_name(x) for x in concept_mgr.text_scope_concepts):
+            zone_beg = view_beg = text.para_base
+        else:
+            zone_beg = max(para_beg - margin, text.para_base)
+            view_beg = max(zone_beg - margin, text.para_base)
+        zone_offset = text.para_offsets[zone_beg - text.para_base]
+
+        new_results = concept_mgr.match(TextView(text, view_beg), filter_by_concept_name)
+        for concept_name in list(concept_results.keys()):
+            results = concept_results[concept_name]
+            results.remove_from(zone_offset)
+            if len(results) == 0:
+                del concept_results[concept_name]
+        for concept_name, results in new_results.items():
+            results = results.slice_by_beg(zone_offset)
+            if len(results) > 0:
+                concept_results.setdefault(concept_name, Results()).add(*results)
+        return concept_results
+
+    @staticmethod
+    def iter_windows(paragraphs, window_len, margin):
+        """
+        将段落分成窗口, 每个窗口由中间部分和两侧各 margin 个段落组成, 相邻窗口的中间部分首尾相接.
+        中间部分至少包含一个段落, 字符数不超过 window_len (单个段落超过时单独作为中间部分).
+        只会保存当前窗口的段落, 内存占用与文档长度无关
+        :param paragraphs: 段落字符串的可迭代对象
+        :param window_len: 中间部分的最大字符数
+        :param margin: 两侧额外包含的段落数目
+        :return: 返回 (窗口第一个段落的序号, 窗口的段落列表, 中间部分的起始序号, 中间部分的结束序号 (开区间)) 的迭代器
+        """
+        paragraphs = iter(paragraphs)
+        # buf 中保存序号从 buf_base 开始的段落
+        buf = []
+        buf_base = 0
+
+        def fill(para_end):
+            """
+            读取段落直到 buf 包含序号 para_end 之前的所有段落 (或者已经读完), 返回 buf 的结束序号
+            """
+            while buf_base + len(buf) < para_end:
+                paragraph = next(paragraphs, None)
+                if paragraph is None:
+                    break
+                buf.append(paragraph)
+            return buf_base + len(buf)
+
+        core_beg = 0
+        while fill(core_beg + 1) > core_beg:
+            core_end = core_beg
+            core_len = 0
+            while fill(core_end + 1) > core_end:
+                para_len = len(buf[core_end - buf_base])
+                if core_end > core_beg and core_len + para_len > window_len:
+                    break
+                core_len += para_len
+                core_end += 1
+
+            win_end = min(fill(core_end + margin), core_end + margin)
+            win_beg = max(core_beg - margin, 0)
+            yield win_beg, buf[win_beg - buf_base: win_end - buf_base], core_beg, core_end
+
+            # 丢弃下一个窗口不需要的段落
+            core_beg = core_end
+            drop = max(core_beg - margin, 0) - buf_base
+            del buf[:drop]
+            buf_base += drop
+
+    def match_long(self, text, filter_by_concept_name=lambda x: False, window_len=None):
+        """
+        长文档匹配, 不截断文本. 将文档按段落分成窗口, 每个窗口单独切分和匹配, 结果的 Index 为整篇文档中的位置.
+        窗口两侧会额外包含 ConceptManager.para_margin 个段落, 所以只使用 @d/@w/@s/@p 范围 (包括过滤) 的概念的结果与整篇匹配一致.
+        @t 范围只在窗口内有效, 依赖 @t 范围的概念 (见 ConceptManager.text_scope_concepts) 的结果可能与整篇匹配不同,
+        需要准确结果时应使用 match 匹配整篇文档.
+        :param text: 输入的文档字符串, 或者段落字符串的可迭代对象 (例如文件对象, 每个段落不能包含 \n)
+        :param filter_by_concept_name: 用于过滤部分不需要运行的 concept, 见 match
+        :param window_len: 每个窗口中间部分的最大字符数, 默认为 config.max_text_len
+        :return: 返回 {concept_name: Results} 的 dict
+        """
+        if isinstance(text, six.text_type):
+            paragraphs = text.split('\n')
+        else:
+            paragraphs = (x.rstrip('\n') for x in text)
+        if window_len is None:
+            window_len = self.config.max_text_len
+
+        concept_mgr = self.concept_mgr
+        if concept_mgr.order is None:
+            concept_mgr.build()
+        margin = concept_mgr.para_margin
+
+        ret = {}
+        offset_base = 0
+        for win_beg, window, core_beg, core_end in self.iter_windows(paragraphs, window_len, margin):
+            window_text = Text(self.config, '\n'.join(window), win_beg, offset_base, truncate=False)
+            concept_results = concept_mgr.match(window_text, filter_by_concept_name)
+            # 只保留起始于中间部分的结果, 窗口依次向后, 所以按顺序加入
+            for concept_name, results in concept_results.items():
+                for result in results:
+                    if core_beg <= result.beg_index.i_para < core_end:
+                        ret.setdefault(concept_name, Results()).add(result)
+            # 下一个窗口的起始段落在当前窗口之内 (或者紧接着当前窗口)
+            next_win_beg = max(core_end - margin, 0)
+            offset_base = window_text.para_offsets[next_win_beg - win_beg]
+        return ret
+
+    def match_many(self, texts, workers=None, chunksize=1, ordered=True, filter_by_concept_name=None):
+        """
+        使用多进程批量匹配, 模型只会传给每个子进程一次
+        :param texts: 文档字符串的可迭代对象
+        :param workers: 进程数, 默认为 CPU 核数, 为 1 时在当前进程中匹配
+        :param chunksize: 每次分发给子进程的文档数目
+        :param ordered: 为 True 时按照输入的顺序返回, 否则按照完成的顺序返回
+        :param filter_by_concept_name: 用于过滤部分不需要运行的 concept, 见 match.
+                                       需要传给子进程, 所以必须可以 pickle (例如模块级的函数)
+        :return: 返回 (doc_id, {concept_name: Results}) 的迭代器, doc_id 为文档在输入中的序号
+        """
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+
+        if workers <= 1:
+            for doc_id, text in enumerate(texts):
+                if filter_by_concept_name is None:
+                    yield doc_id, self.match(text)
+                else:
+                    yield doc_id, self.match(text, filter_by_concept_name)
+            return
+
+        pool = multiprocessing.Pool(workers, _init_match_worker, (self, filter_by_concept_name))
+        try:
+            if ordered:
+                results_iter = pool.imap(_match_worker, enumerate(texts), chunksize)
+            else:
+                results_iter = pool.imap_unordered(_match_worker, enumerate(texts), chunksize)
+            for item in results_iter:
+                yield item
+        finally:
+            pool.terminate()
+            pool.join()
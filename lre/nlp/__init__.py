@@ -4,10 +4,37 @@
 """
 from __future__ import unicode_literals
 
+import threading
+
 from .nlp_zh import NlpZh
+from ..cache import LRUCache
 
 
 class Nlp(object):
+    """
+    切分段落、句子、词的入口. 对象本身没有状态, 同一配置下应该通过 Nlp.get 共享同一个对象 (线程安全)
+    """
+
+    # 配置字段的值 => Nlp 对象
+    __instances = {}
+    __instances_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, config):
+        """
+        获取配置对应的共享 Nlp 对象, 字段值相同的配置共享同一个对象
+        :param config: 存储配置信息的对象
+        :return: 返回 Nlp 对象
+        """
+        key = tuple(sorted(config.to_dict().items()))
+        nlp = cls.__instances.get(key)
+        if nlp is None:
+            with cls.__instances_lock:
+                nlp = cls.__instances.get(key)
+                if nlp is None:
+                    nlp = cls(config)
+                    cls.__instances[key] = nlp
+        return nlp
 
     def __init__(self, config):
         self.config = config
@@ -15,14 +42,22 @@ class Nlp(object):
             self.nlp = NlpZh(config)
         else:
             raise ValueError('invalid_language', config.language)
+        # 句子 => 词的 tuple 的缓存, 未开启时为 None
+        if config.sent_cache_size:
+            self.sent_cache = LRUCache(config.sent_cache_size)
+        else:
+            self.sent_cache = None
 
-    def text2para(self, text):
+    def text2para(self, text, truncate=True):
         """
         从文本切分成为段落, 会依据 config 的 language 来切分
         :param text: 输入的文本整体，段落以 \n 作为分割
+        :param truncate: 是否截断到 config.max_text_len, 长文档分窗口切分时不截断
         :return: 返回段落的列表
         """
-        return self.nlp.text2para(text[:self.config.max_text_len])
+        if truncate:
+            text = text[:self.config.max_text_len]
+        return self.nlp.text2para(text)
 
     def para2sent(self, paragraph):
         """
@@ -36,6 +71,19 @@ class Nlp(object):
         """
         从句子切分成词，会依据 config 的 language 来切分
         :param sentence: 输入的句子文本
-        :return: 返回词的列表
+        :return: 返回词的列表, 开启了句子缓存时为 tuple
+        """
+        if self.sent_cache is None:
+            return self.nlp.sent2word(sentence)
+
+        words = self.sent_cache.get(sentence)
+        if words is None:
+            words = tuple(self.nlp.sent2word(sentence))
+            self.sent_cache.put(sentence, words)
+        return words
+
+    def warmup(self):
+        """
+        预先加载分词需要的词典等资源, 避免第一次切分时的延迟
         """
-        return self.nlp.sent2word(sentence)
+        self.nlp.warmup()
@@ -5,18 +5,53 @@
 from __future__ import unicode_literals
 
 import re
+import threading
 
-import jieba.posseg as pseg
 import six
 
+# jieba.posseg 模块, 第一次需要 jieba 分词时才导入 (导入和加载词典都比较慢), 见 load_jieba
+_pseg = None
+_pseg_lock = threading.Lock()
+
+
+def load_jieba():
+    """
+    导入 jieba.posseg 并加载词典, 多线程下只会加载一次
+    :return: 返回 jieba.posseg 模块
+    """
+    global _pseg
+    if _pseg is None:
+        with _pseg_lock:
+            if _pseg is None:
+                import jieba
+                import jieba.posseg
+                jieba.initialize()
+                _pseg = jieba.posseg
+    return _pseg
+
 
 @six.python_2_unicode_compatible
 class NlpZh(object):
     __re_sent = re.compile('[!。！…?？]')
+    # 字符级别切分时的 token: 单个汉字, 数字 (jieba 的 m), 英文 (jieba 的 eng), 与 jieba 内部的正则一致
+    __re_char = re.compile('[\u4E00-\u9FD5]|[\\.0-9]+|[a-zA-Z0-9]+')
 
     def __init__(self, config):
         self.config = config
 
+    def uses_jieba(self):
+        """
+        当前配置下切分句子是否需要 jieba
+        """
+        return not (self.config.word_level == 'char' and self.config.fast_char_cut)
+
+    def warmup(self):
+        """
+        预先加载需要的词典, 避免第一次切分时的延迟
+        """
+        if self.uses_jieba():
+            load_jieba()
+
     def text2para(self, text):
         """
         从文本切分成为段落
@@ -41,7 +76,34 @@ class NlpZh(object):
         :param sentence: 输入的句子文本
         :return: 返回词的列表
         """
-        words = pseg.cut(sentence)
+        if self.uses_jieba():
+            return self.sent2word_jieba(sentence)
+        else:
+            return self.sent2char(sentence)
+
+    def sent2char(self, sentence):
+        """
+        字符级别的快速切分, 不调用 jieba, 按字符类型模拟 jieba 切分后再拆成单字的结果:
+        汉字逐个输出, 英文 (可以包含数字) 整体转为小写, 数字逐个字符输出, 标点和其他字符丢弃.
+        依赖 jieba 词典的情况结果不同, 例如 T恤/U盘 (jieba 为词典词, 拉丁字母不转小写),
+        C++ (jieba 保留 +), 1,000元 (jieba 把 1 标注为标点丢弃), 所以只在 config.fast_char_cut 开启时使用
+        :param sentence: 输入的句子文本
+        :return: 返回词的列表
+        """
+        for token in self.__class__.__re_char.findall(sentence):
+            if token[0] in '.0123456789':  # 数字, jieba 标注为 m, 按字符拆开
+                for ch in token:
+                    yield ch
+            else:  # 汉字或者英文
+                yield token.lower()
+
+    def sent2word_jieba(self, sentence):
+        """
+        使用 jieba 分词切分句子
+        :param sentence: 输入的句子文本
+        :return: 返回词的列表
+        """
+        words = load_jieba().cut(sentence)
         # 注意！非英语的拉丁语会出现部分切分成为标点（x），部分会变成英文（eng）
         for word, pos in words:
             if pos == 'x':  # 标点不要（包含全半角空格）
@@ -51,7 +113,6 @@ class NlpZh(object):
             else:  # 中文
                 if self.config.word_level == 'char':
                     for ch in word:
-                        ch = ch
                         yield ch
                 elif self.config.word_level == 'word':
                     yield word
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+规则的执行计划, 用于在概念之间共享结构相同的子规则
+"""
+from __future__ import unicode_literals
+
+
+def compile_node(node, shared=None):
+    """
+    编译一个 rule/filter/arg 节点, 需要共享的节点返回带缓存的匹配函数
+    :param node: 待编译的节点
+    :param shared: SharedPlans 对象, None 表示不共享
+    :return: 返回 match(text, limit=None) 函数
+    """
+    if shared is None:
+        return node.compile()
+    return shared.compile(node)
+
+
+class SharedPlans(object):
+    """
+    概念之间共享的子规则. 结构 (见各节点的 structure) 相同的子规则只编译一次,
+    匹配时每篇文档只计算一次, 结果缓存在 TextContext 中, 所有引用它的规则共用
+    """
+
+    def __init__(self, keys=()):
+        """
+        :param keys: 需要共享的子规则的结构, 一般是在多处出现的子规则
+        """
+        # 结构 => 共享的编号, 用作 TextContext 中的缓存 key
+        self.ids = dict((key, i) for i, key in enumerate(sorted(keys, key=repr)))
+        # 下一个可用的编号, 编号不会重复使用
+        self.next_id = len(self.ids)
+        # 共享的编号 => 带缓存的匹配函数
+        self.matches = {}
+
+    def __getstate__(self):
+        # 匹配函数不能序列化, 加载后编译时重新生成
+        return {'ids': self.ids, 'next_id': self.next_id}
+
+    def __setstate__(self, state):
+        self.ids = state['ids']
+        self.next_id = state.get('next_id', len(self.ids))
+        self.matches = {}
+
+    def update(self, keys):
+        """
+        替换需要共享的子规则: 仍然共享的保持原有的编号和匹配函数, 新增的使用新的编号, 不再共享的被丢弃.
+        编号不会重复使用, 所以使用旧对象编译的匹配函数仍然可以与新对象编译的混用
+        :param keys: 需要共享的子规则的结构
+        :return: 返回新的 SharedPlans 对象, 不修改自身 (可能正在被其他线程使用)
+        """
+        ret = self.__class__()
+        ret.next_id = self.next_id
+        for key in sorted(set(keys), key=repr):
+            shared_id = self.ids.get(key)
+            if shared_id is None:
+                shared_id = ret.next_id
+                ret.next_id += 1
+            else:
+                match = self.matches.get(shared_id)
+                if match is not None:
+                    ret.matches[shared_id] = match
+            ret.ids[key] = shared_id
+        return ret
+
+    def is_shared(self, node):
+        """
+        节点是否需要共享
+        :param node: rule/filter/arg 节点
+        :return: 返回是否需要共享
+        """
+        return node.structure() in self.ids
+
+    def compile(self, node):
+        """
+        编译一个节点, 需要共享的节点第一次编译时生成带缓存的匹配函数, 之后直接复用
+        :param node: 待编译的节点
+        :return: 返回 match(text, limit=None) 函数
+        """
+        shared_id = self.ids.get(node.structure())
+        if shared_id is None:
+            return node.compile(self)
+
+        match = self.matches.get(shared_id)
+        if match is None:
+            match = self.matches[shared_id] = self.share(shared_id, node.compile(self))
+        return match
+
+    @staticmethod
+    def share(shared_id, node_match):
+        """
+        生成带缓存的匹配函数
+        :param shared_id: 共享的编号
+        :param node_match: 节点本身的匹配函数
+        :return: 返回 match(text, limit=None) 函数, text 必须是 TextContext 对象
+        """
+
+        def match(text, limit=None):
+            return text.match_shared(shared_id, node_match, limit)
+
+        return match
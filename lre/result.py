@@ -4,14 +4,48 @@
 """
 from __future__ import unicode_literals
 
+from bisect import bisect_left, bisect_right
+
 import six
 
+# 拉丁字母的 unicode 区间 (闭区间), 相邻的区间已经合并, 按起始位置排序
+LATIN_RANGES = (
+    (0x0000, 0x02AF), (0x1D00, 0x1DBF), (0x1E00, 0x1EFF), (0x2C60, 0x2C7F),
+    (0xA720, 0xA7FF), (0xAB30, 0xAB6F), (0xFB00, 0xFB4F), (0xFF00, 0xFFEF),
+)
+LATIN_BEGS = [x[0] for x in LATIN_RANGES]
+
+
+def is_latin(ch):
+    """
+    判断字符是否是拉丁字母 (包括 ASCII 和全角字符)
+    :param ch: 单个字符
+    :return: 返回是否是拉丁字母
+    """
+    o = ord(ch)
+    i = bisect_right(LATIN_BEGS, o) - 1
+    return i >= 0 and o <= LATIN_RANGES[i][1]
+
+
+def need_space(prev, curr):
+    """
+    中文 join 时两个相邻词条之间是否需要增加空格: 相邻两个字符中存在拉丁字母时需要.
+    因为拉丁字母肯定会和中文分开, 所以只需要看前一个词的最后一个字符和后一个词的第一个字符
+    :param prev: 前一个词条
+    :param curr: 后一个词条
+    :return: 返回是否需要空格
+    """
+    return is_latin(prev[-1]) or is_latin(curr[0])
+
 
 @six.python_2_unicode_compatible
 class Result(object):
     """
     单个结果的存储对象, 包含的主要是 Term 的队列.
+    每个词条和每次规则组合都会生成 Result, 所以使用 __slots__ 减少内存占用, 生成后不可修改.
+    两个 Result 的 (起始 offset, 结束 offset, bias) 相同即认为相等, Results 依此去重.
     """
+    __slots__ = ('config', 'word_list', 'beg_index', 'end_index', 'bias')
 
     def __init__(self, config, word_list, beg_index, end_index, bias):
         """
@@ -21,11 +55,49 @@ class Result(object):
         :param end_index: 结束 Index 对象 (闭区间)
         :param bias: 偏离量, 在强制 concept 长度为 1 的场景中用来作为偏移值减去
         """
-        self.config = config
-        self.word_list = word_list
-        self.beg_index = beg_index
-        self.end_index = end_index
-        self.bias = bias
+        set_attr = object.__setattr__
+        set_attr(self, 'config', config)
+        set_attr(self, 'word_list', word_list)
+        set_attr(self, 'beg_index', beg_index)
+        set_attr(self, 'end_index', end_index)
+        set_attr(self, 'bias', bias)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Result is immutable', name)
+
+    def __reduce__(self):
+        return self.__class__, (self.config, self.word_list, self.beg_index, self.end_index, self.bias)
+
+    @property
+    def key(self):
+        """
+        用于比较和去重的 (起始 offset, 结束 offset, bias)
+        """
+        return self.beg_index.offset, self.end_index.offset, self.bias
+
+    def __eq__(self, other):
+        if not isinstance(other, Result):
+            return NotImplemented
+        return self.beg_index.offset == other.beg_index.offset \
+               and self.end_index.offset == other.end_index.offset \
+               and self.bias == other.bias
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    def __hash__(self):
+        return hash((self.beg_index.offset, self.end_index.offset, self.bias))
+
+    def with_bias(self, bias):
+        """
+        生成一个范围相同, 但偏离量不同的新 Result, 原 Result 不变 (例如 Text.word_map 中的 Result)
+        :param bias: 新的偏离量
+        :return: 返回新的 Result 对象, 偏离量相同时直接返回自身
+        """
+        if bias == self.bias:
+            return self
+        return Result(self.config, self.word_list, self.beg_index, self.end_index, bias)
 
     def __str__(self):
         return 'Result(text={0}, beg_index={1}, end_index={2}, bias={3})'.format(
@@ -51,41 +123,26 @@ class Result(object):
         :param word_list: 待 join 的词的列表
         :return: 返回 join 后的词的列表
         """
-
-        def is_latin(ch):
-            o = ord(ch)
-            if 0x0000 <= o <= 0x007F or 0x0080 <= o <= 0x00FF or 0x0100 <= o <= 0x017F \
-                    or 0x0180 <= o <= 0x024F or 0x2C60 <= o <= 0x2C7F or 0xA720 <= o <= 0xA7FF \
-                    or 0xAB30 <= o <= 0xAB6F or 0x1E00 <= o <= 0x1EFF or 0xFF00 <= o <= 0xFFEF \
-                    or 0xFB00 <= o <= 0xFB4F or 0x0250 <= o <= 0x02AF or 0x1D00 <= o <= 0x1D7F \
-                    or 0x1D80 <= o <= 0x1DBF:
-                return True
-            else:
-                return False
-
         if len(word_list) == 1:
             return word_list[0]
 
         index = 1
         join_words = [word_list[0]]
         while index < len(word_list):
-            prev = word_list[index - 1]
-            curr = word_list[index]
-            # 因为拉丁字母肯定会和中文分开, 所以只需要看最后一个字符和第一个字符就行
-            if is_latin(prev[-1]) or is_latin(curr[0]):
+            if need_space(word_list[index - 1], word_list[index]):
                 # 命中, 添加空格
                 join_words.append(' ')
-            join_words.append(curr)
+            join_words.append(word_list[index])
             index += 1
         return ''.join(join_words)
 
     @property
     def text(self):
         """
-        返回拼接后的文本
+        返回拼接后的文本, 使用 word_list 预先计算的拼接片段, 相同范围的文本只拼接一次, 见 WordList.join
         """
         if self.config.language == 'zh':
-            return self.zh_join(self.word_list[self.beg_index.offset: self.end_index.offset + 1])
+            return self.word_list.join(self.beg_index.offset, self.end_index.offset)
         else:
             raise ValueError('invalid_language', self.config.language)
 
@@ -94,7 +151,7 @@ class Result(object):
         """
         是否命中, 命中表示有匹配结果,
         """
-        return self.end_index.offset >= self.beg_inde.offset
+        return self.end_index.offset >= self.beg_index.offset
 
     def overlap(self, other):
         """
@@ -107,26 +164,109 @@ class Result(object):
     def matched_words(self):
         """
         返回匹配到的词列表, 实际上是:
-            self.word_list[self.beg_index.offset: self.end_index.offset + 1]
+            self.word_list.span(self.beg_index.offset, self.end_index.offset)
         :return: 返回匹配到的词条
         """
-        return self.word_list[self.beg_index.offset: self.end_index.offset + 1]
+        return self.word_list.span(self.beg_index.offset, self.end_index.offset)
+
+
+def merge_results(list_a, list_b):
+    """
+    合并两个有序且去重的 Result 列表, 保持有序且去重
+    :param list_a: 按 key 排序的 Result 列表
+    :param list_b: 按 key 排序的 Result 列表
+    :return: 返回合并后的新列表
+    """
+    ret = []
+    i, j = 0, 0
+    len_a, len_b = len(list_a), len(list_b)
+    while i < len_a and j < len_b:
+        key_a = list_a[i].key
+        key_b = list_b[j].key
+        if key_a < key_b:
+            ret.append(list_a[i])
+            i += 1
+        elif key_b < key_a:
+            ret.append(list_b[j])
+            j += 1
+        else:
+            ret.append(list_a[i])
+            i += 1
+            j += 1
+    ret.extend(list_a[i:])
+    ret.extend(list_b[j:])
+    return ret
+
+
+def subtract_results(list_a, list_b):
+    """
+    从有序且去重的 Result 列表中删除另一个有序列表中的元素
+    :param list_a: 按 key 排序的 Result 列表
+    :param list_b: 按 key 排序的 Result 列表, 待删除的元素
+    :return: 返回删除后的新列表
+    """
+    ret = []
+    j, len_b = 0, len(list_b)
+    for result in list_a:
+        key = result.key
+        while j < len_b and list_b[j].key < key:
+            j += 1
+        if j < len_b and list_b[j].key == key:
+            continue
+        ret.append(result)
+    return ret
 
 
 @six.python_2_unicode_compatible
 class Results(object):
     """
     存放若干 Result 对象的对象 (自动去重). 同时包含一些好用的方法.
+
+    内部使用按 (起始 offset, 结束 offset, bias) 排序的数组存放, 迭代顺序是确定的.
+    合并/删除通过归并完成, 同时提供按起始/结束位置的二分查找, 方便规则连接和过滤时剪枝.
+    按顺序添加 Result 时直接追加 (同时追加起始 offset 的缓存), 乱序添加时会在下次读取前统一排序去重.
     """
 
     def __init__(self):
-        self.result_set = set()
+        # 按 key 排序的 Result 列表, self.ordered 为 False 时可能无序/重复
+        self.result_list = []
+        self.ordered = True
+        # 读取时生成的缓存, 修改后失效
+        self._beg_offsets = None
+        self._by_end = None
+        self._end_offsets = None
+
+    def _changed(self):
+        """
+        内容修改后使缓存失效
+        """
+        self._beg_offsets = None
+        self._by_end = None
+        self._end_offsets = None
+
+    def _normalize(self):
+        """
+        保证 result_list 有序且去重. 生成新的列表后再替换, 不会影响正在读取的迭代器
+        """
+        if self.ordered:
+            return
+        result_list = []
+        last_key = None
+        for result in sorted(self.result_list, key=lambda x: x.key):
+            key = result.key
+            if key != last_key:
+                result_list.append(result)
+                last_key = key
+        self.result_list = result_list
+        self.ordered = True
 
     def clean(self):
         """
         清空对象所包含的所有内容 (等效于初始化)
         """
-        self.result_set.clear()
+        self.result_list = []
+        self.ordered = True
+        self._changed()
 
     def add(self, *element_list):
         """
@@ -136,31 +276,207 @@ class Results(object):
         for element in element_list:
             # Result 对象
             if isinstance(element, Result):
-                self.result_set.add(element)
+                result_list = self.result_list
+                if self.ordered and result_list:
+                    last_key = result_list[-1].key
+                    key = element.key
+                    if key == last_key:  # 重复
+                        continue
+                    elif key < last_key:  # 乱序
+                        self.ordered = False
+                result_list.append(element)
+                if self.ordered and self._beg_offsets is not None:
+                    # 按顺序追加时起始 offset 的缓存仍然有效, 例如 Text.append 之后的关键词结果
+                    self._beg_offsets.append(element.beg_index.offset)
+                    self._by_end = None
+                    self._end_offsets = None
+                else:
+                    self._changed()
             # Results 对象
             elif isinstance(element, Results):
-                self.result_set.update(element.result_set)
+                if not element:
+                    continue
+                self._normalize()
+                element._normalize()
+                if self.result_list:
+                    self.result_list = merge_results(self.result_list, element.result_list)
+                else:
+                    self.result_list = list(element.result_list)
+                self._changed()
             else:
                 continue
 
+    @classmethod
+    def union(cls, results_list):
+        """
+        合并多个 Results, 结果与逐个 add 相同, 但只在最后生成一个新的 Results
+        :param results_list: Results 对象的列表
+        :return: 返回合并后的新 Results 对象
+        """
+        ret = cls()
+        result_lists = []
+        for results in results_list:
+            if results:
+                results._normalize()
+                result_lists.append(results.result_list)
+        if len(result_lists) == 1:
+            ret.result_list = list(result_lists[0])
+        elif result_lists:
+            result_list = result_lists[0]
+            for other in result_lists[1:]:
+                result_list = merge_results(result_list, other)
+            ret.result_list = result_list
+        return ret
+
+    @classmethod
+    def union_until(cls, results_iter, limit):
+        """
+        逐个合并 Results, 合并后达到 limit 个结果即停止, 剩余的 Results 不再计算.
+        得到的不一定是最早的 limit 个结果, 但少于 limit 个时一定是全部结果
+        :param results_iter: Results 对象的可迭代对象, 一般是生成器, 用于延迟计算
+        :param limit: 需要的结果数目
+        :return: 返回合并后的新 Results 对象
+        """
+        ret = cls()
+        for results in results_iter:
+            if results:
+                ret = cls.union([ret, results])
+                if len(ret) >= limit:
+                    break
+        return ret
+
     def remove(self, element):
         """
         通过传递一个 Result / Results 对象来删除多个 Result
         :param element: Results / Result 对象
         """
+        self._normalize()
         if isinstance(element, Result):
-            self.result_set.discard(element)
+            self.result_list = [x for x in self.result_list if x != element]
         elif isinstance(element, Results):
-            self.result_set.difference_update(element.result_set)
+            element._normalize()
+            self.result_list = subtract_results(self.result_list, element.result_list)
+        self._changed()
+
+    def remove_from(self, beg_offset):
+        """
+        原地删除起始 offset 不小于 beg_offset 的结果, 只会扫描被删除的尾部
+        :param beg_offset: 起始 offset 的下界 (闭区间)
+        """
+        self._normalize()
+        result_list = self.result_list
+        i = len(result_list)
+        while i > 0 and result_list[i - 1].beg_index.offset >= beg_offset:
+            i -= 1
+        if i < len(result_list):
+            del result_list[i:]
+            if self._beg_offsets is not None:
+                del self._beg_offsets[i:]
+            self._by_end = None
+            self._end_offsets = None
+
+    @property
+    def beg_offsets(self):
+        """
+        与迭代顺序对应的起始 offset 列表 (升序), 可用于二分查找
+        """
+        self._normalize()
+        if self._beg_offsets is None:
+            self._beg_offsets = [x.beg_index.offset for x in self.result_list]
+        return self._beg_offsets
+
+    @property
+    def by_end(self):
+        """
+        按 (结束 offset, 起始 offset, bias) 排序的 Result 列表
+        """
+        self._normalize()
+        if self._by_end is None:
+            self._by_end = sorted(self.result_list, key=lambda x: (x.end_index.offset, x.beg_index.offset, x.bias))
+        return self._by_end
+
+    @property
+    def end_offsets(self):
+        """
+        与 by_end 对应的结束 offset 列表 (升序), 可用于二分查找
+        """
+        if self._end_offsets is None:
+            self._end_offsets = [x.end_index.offset for x in self.by_end]
+        return self._end_offsets
+
+    def slice_by_beg(self, lo, hi=None):
+        """
+        取出起始 offset 在 [lo, hi] 范围内的结果
+        :param lo: 起始 offset 的下界 (闭区间)
+        :param hi: 起始 offset 的上界 (闭区间), None 表示不限制
+        :return: 返回新的 Results 对象
+        """
+        beg_offsets = self.beg_offsets
+        i = bisect_left(beg_offsets, lo)
+        j = len(beg_offsets) if hi is None else bisect_right(beg_offsets, hi)
+        ret = Results()
+        ret.result_list = self.result_list[i:j]
+        return ret
+
+    def head(self, n):
+        """
+        取出前 n 个结果 (按迭代顺序)
+        :param n: 结果数目
+        :return: 返回新的 Results 对象, 结果数目不超过 n 时直接返回自身
+        """
+        if len(self) <= n:
+            return self
+        ret = Results()
+        ret.result_list = self.result_list[:n]
+        return ret
+
+    def slice_by_end(self, lo, hi=None):
+        """
+        取出结束 offset 在 [lo, hi] 范围内的结果
+        :param lo: 结束 offset 的下界 (闭区间)
+        :param hi: 结束 offset 的上界 (闭区间), None 表示不限制
+        :return: 返回新的 Results 对象
+        """
+        end_offsets = self.end_offsets
+        i = bisect_left(end_offsets, lo)
+        j = len(end_offsets) if hi is None else bisect_right(end_offsets, hi)
+        ret = Results()
+        ret.add(*self.by_end[i:j])
+        return ret
+
+    def __getstate__(self):
+        # 只保存有序的结果列表, 缓存在读取时重新生成
+        self._normalize()
+        return {'result_list': self.result_list}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.result_list = state['result_list']
 
     def __str__(self):
-        return 'Results([{0}])'.format(', '.join([six.text_type(x) for x in self.result_set]))
+        return 'Results([{0}])'.format(', '.join([six.text_type(x) for x in self]))
 
     def __repr__(self):
         return self.__str__()
 
     def __len__(self):
-        return len(self.result_set)
+        self._normalize()
+        return len(self.result_list)
+
+    def __bool__(self):
+        # 是否为空与是否有序无关, 不需要排序去重
+        return len(self.result_list) > 0
+
+    __nonzero__ = __bool__
 
     def __iter__(self):
-        return self.result_set.__iter__()
+        self._normalize()
+        return self.result_list.__iter__()
+
+    def __getitem__(self, i):
+        self._normalize()
+        return self.result_list[i]
+
+
+# 共享的空结果, 匹配函数没有结果时返回, 避免每次生成新的 Results. 与其他匹配结果一样不可修改
+EMPTY_RESULTS = Results()
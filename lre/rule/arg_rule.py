@@ -5,6 +5,7 @@
 from __future__ import unicode_literals
 
 from .base_rule import BaseRule
+from ..plan import compile_node
 
 
 class ArgRule(BaseRule):
@@ -30,15 +31,17 @@ class ArgRule(BaseRule):
                 ', '.join(supported_arg_names)
             ), arg_name)
 
-    def match(self, text):
+    def structure(self):
         """
-        匹配对象进行文本的规则匹配
-        :param text: 待匹配的 Text 对象
-        :return: 返回查找到的 Results 对象, 如果不存在返回 None
+        用于判断子规则是否相同的结构, 与参数本身相同
+        :return: 返回 tuple
         """
-        # 如果没有匹配到就返回一个空的 Results
-        # 用来存放每个 arg 的匹配 Results
-        match_arg = self.args[0]
-        results = match_arg.match(text)
+        return self.args[0].structure()
 
-        return results
+    def compile(self, shared=None):
+        """
+        编译成匹配函数, 直接使用参数的匹配函数
+        :param shared: 共享子规则的 SharedPlans 对象, 见 lre.plan, None 表示不共享
+        :return: 返回 match(text, limit=None) 函数
+        """
+        return compile_node(self.args[0], shared)
@@ -4,7 +4,7 @@
 """
 from __future__ import unicode_literals
 
-import copy
+from bisect import bisect_left
 
 import six
 
@@ -49,75 +49,148 @@ class BagRule(BaseRule):
                     ', '.join(self.__class__.default_supported_arg_names)
                 ), index + 1, arg_name)
 
-    def recur_compose_result(self, results_cache, tmp_results, index, results):
+    @staticmethod
+    def insert_interval(intervals, beg_offset, end_offset):
         """
-        递归来组合结果. 依据输入的每个 arg 对应的 Results, 通过 arg 的前后顺序进行筛选.
+        向已经覆盖的区间中插入一个新的区间
+        :param intervals: 按起始位置排序且互不重叠的 (beg offset, end offset) 区间 tuple
+        :param beg_offset: 新区间的起始 offset (闭区间)
+        :param end_offset: 新区间的结束 offset (闭区间)
+        :return: 返回插入后的区间 tuple, 如果与已有区间重叠返回 None
+        """
+        i = bisect_left(intervals, (beg_offset, end_offset))
+        if i > 0 and intervals[i - 1][1] >= beg_offset:
+            return None
+        if i < len(intervals) and intervals[i][0] <= end_offset:
+            return None
+        return intervals[:i] + ((beg_offset, end_offset),) + intervals[i:]
+
+    def compose_result(self, text, rule_range, results_cache, limit=None):
+        """
+        无序组合各个 arg 的结果. 部分结果记录已经覆盖的区间, 每一步加入下一列中不重叠的结果:
+
+            1. 部分结果只记录 (覆盖区间, 起始 Index, 结束 Index, 累计 bias), 相同的部分结果只保留一份
+            2. 使用二分查找判断新结果是否与覆盖区间重叠
+            3. 组合过程中使用范围参数判断, 超出范围的部分结果不会再继续组合,
+               待组合的结果也只会在范围允许的位置查找
+
+        :param text: 待匹配的 Text 对象
+        :param rule_range: 范围参数 RuleRangeArg 对象
         :param results_cache: 逐个 arg 对应的 Results 对象
-        :param tmp_results: 当前组合的已完成结果, 记录的是每个 arg 对应的一种 Result 情况
-        :param index: 当前计算的 results_cache 的索引号
-        :param results: 最终存放组合完毕的 Result (输出)
+        :param limit: 需要的结果数目, None 表示需要全部结果. 无序组合的起始位置是最靠前的那个元素,
+                      所以按起始位置从前往后, 依次以每一列在该位置的结果作为最靠前的元素组合,
+                      得到足够的结果即可停止
+        :return: 返回组合完成的 Results 对象
+        """
+        # 覆盖区间不同的组合可能得到相同的结果, 先按 (beg offset, end offset, bias) 去重, 最后再按顺序生成 Result
+        composed = {}
+        if limit is None:
+            # 按首列的起始位置分组组合, 部分结果只需要保存一组
+            for seeds in self.group_by_beg(results_cache[0]):
+                chains = self.seed_chains(rule_range, seeds)
+                self.add_chains(composed, self.extend_chains(rule_range, chains, results_cache[1:]))
+            return self.build_results(text, composed)
+
+        beg_offsets = sorted(set(offset for arg_results in results_cache for offset in arg_results.beg_offsets))
+        for beg_offset in beg_offsets:
+            for i, arg_results in enumerate(results_cache):
+                # 元素之间不重叠, 所以最靠前的元素只有一个, 不同的列不会得到相同的组合
+                chains = self.seed_chains(rule_range, arg_results.slice_by_beg(beg_offset, beg_offset))
+                chains = self.extend_chains(rule_range, chains, results_cache[:i] + results_cache[i + 1:], beg_offset)
+                self.add_chains(composed, chains)
+            if len(composed) >= limit:
+                break
+        return self.build_results(text, composed)
+
+    @staticmethod
+    def add_chains(composed, chains):
         """
-        if index == len(results_cache):  # 所有都运行完成
-            if len(tmp_results) == len(results_cache):  # 匹配的部分
-                # 利用 bit_map 判断是否有重叠
-                bit_map = [0] * len(tmp_results[0].word_list)
-                # 重新生成一个 result
-                min_beg_offset = 999999
-                min_beg_index = None
-                max_end_offset = -1
-                max_end_index = None
-                total_bias = 0
-                for tmp_result in tmp_results:
-                    # 有重叠
-                    if sum(bit_map[tmp_result.beg_index.offset: tmp_result.end_index.offset + 1]) > 0:
-                        return
-
-                    # 累加 bias
-                    total_bias += tmp_result.bias
-
-                    # 没重叠添加当前结果覆盖的部分的部分
-                    for i in six.moves.range(tmp_result.beg_index.offset, tmp_result.end_index.offset + 1):
-                        bit_map[i] = 1
-
-                    if tmp_result.beg_index.offset < min_beg_offset:
-                        min_beg_offset = tmp_result.beg_index.offset
-                        min_beg_index = tmp_result.beg_index
-                    if tmp_result.end_index.offset > max_end_offset:
-                        max_end_offset = tmp_result.end_index.offset
-                        max_end_index = tmp_result.end_index
-
-                result = Result(self.config, tmp_results[0].word_list, min_beg_index, max_end_index, total_bias)
-                results.add(result)
-            return
-
-        for result in results_cache[index]:
-            cur_results = copy.copy(tmp_results)
-            cur_results.append(result)
-            self.recur_compose_result(results_cache, cur_results, index + 1, results)
-
-    def match(self, text):
+        记录组合完成的部分结果, 相同的结果只保留一份
+        :param composed: (beg offset, end offset, bias) => (beg_index, end_index, bias) 的 dict
+        :param chains: 组合完成的部分结果
+        """
+        for intervals, beg_index, end_index, bias in chains.values():
+            composed[(beg_index.offset, end_index.offset, bias)] = (beg_index, end_index, bias)
+
+    def build_results(self, text, composed):
         """
-        匹配对象进行文本的规则匹配
+        按顺序生成 Result, 直接追加到 Results 中, 不需要再排序去重
         :param text: 待匹配的 Text 对象
-        :return: 返回查找到的 Results 对象, 如果不存在返回 None
+        :param composed: (beg offset, end offset, bias) => (beg_index, end_index, bias) 的 dict
+        :return: 返回 Results 对象
         """
-        rule_range = self.args[0]
-        match_args = self.args[1:]
-        # 如果没有匹配到就返回一个空的 Results
         results = Results()
-        # 用来存放每个 arg 的匹配 Results
-        results_cache = []
-        for arg in match_args:
-            arg_results = arg.match(text)
-            if len(arg_results) == 0:
-                return results
-            else:
-                results_cache.append(arg_results)
-
-        # 递归拼接结果
-        self.recur_compose_result(results_cache, [], 0, results)
-
-        # 使用范围参数过滤
-        results = rule_range.filter(results)
-
+        for key in sorted(composed):
+            beg_index, end_index, bias = composed[key]
+            results.add(Result(self.config, text.word_list, beg_index, end_index, bias))
         return results
+
+    @staticmethod
+    def seed_chains(rule_range, seeds):
+        """
+        生成只包含一个元素的部分结果
+        :param rule_range: 范围参数 RuleRangeArg 对象
+        :param seeds: 作为第一个元素的结果
+        :return: 返回 (覆盖区间, bias) => (覆盖区间, beg_index, end_index, bias) 的部分结果
+        """
+        chains = {}
+        for result in seeds:
+            if rule_range.accept(result.beg_index, result.end_index, result.bias):
+                intervals = ((result.beg_index.offset, result.end_index.offset),)
+                chains[(intervals, result.bias)] = (intervals, result.beg_index, result.end_index, result.bias)
+        return chains
+
+    def extend_chains(self, rule_range, chains, results_cache, min_beg_offset=None):
+        """
+        将部分结果依次与之后每一列结果组合
+        :param rule_range: 范围参数 RuleRangeArg 对象
+        :param chains: 首列的部分结果
+        :param results_cache: 之后每一列的 Results 对象
+        :param min_beg_offset: 组合的元素起始位置的下界, None 表示不限制
+        :return: 返回组合完成的部分结果
+        """
+        for arg_results in results_cache:
+            if not chains:
+                break
+
+            # Results 本身按照起始位置排序, 同时提供按照结束位置排序的列表
+            by_beg = arg_results
+            beg_offsets = arg_results.beg_offsets
+            by_end = arg_results.by_end
+            end_offsets = arg_results.end_offsets
+
+            next_chains = {}
+
+            def extend(intervals, beg_index, end_index, bias, result):
+                intervals = self.insert_interval(intervals, result.beg_index.offset, result.end_index.offset)
+                if intervals is None:  # 有重叠
+                    return
+                if result.beg_index.offset < beg_index.offset:
+                    beg_index = result.beg_index
+                if result.end_index.offset > end_index.offset:
+                    end_index = result.end_index
+                bias += result.bias
+                if rule_range.accept(beg_index, end_index, bias):
+                    next_chains[(intervals, bias)] = (intervals, beg_index, end_index, bias)
+
+            for intervals, beg_index, end_index, bias in chains.values():
+                # 起始位置不早于部分结果的, 包括覆盖区间之间的空隙和之后的部分
+                for i in six.moves.range(bisect_left(beg_offsets, beg_index.offset), len(beg_offsets)):
+                    result = by_beg[i]
+                    if rule_range.out_of_range(beg_index, bias, result.beg_index):
+                        break
+                    extend(intervals, beg_index, end_index, bias, result)
+
+                # 结束位置早于部分结果的, 由近及远
+                for i in six.moves.range(bisect_left(end_offsets, beg_index.offset) - 1, -1, -1):
+                    result = by_end[i]
+                    if rule_range.out_of_range(result.end_index, bias, end_index):
+                        break
+                    if min_beg_offset is not None and result.beg_index.offset < min_beg_offset:
+                        if result.end_index.offset < min_beg_offset:
+                            break
+                        continue
+                    extend(intervals, beg_index, end_index, bias, result)
+
+            chains = next_chains
+        return chains
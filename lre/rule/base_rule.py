@@ -6,6 +6,9 @@ from __future__ import unicode_literals
 
 import six
 
+from ..plan import compile_node
+from ..result import EMPTY_RESULTS
+
 
 @six.python_2_unicode_compatible
 class BaseRule(object):
@@ -34,6 +37,97 @@ class BaseRule(object):
         """
         pass
 
+    def find_triggers(self, concept_triggers):
+        """
+        计算命中该规则的必要关键词集合 (至少出现其中一个). 默认所有参数都必须命中,
+        所以任取一个参数的集合即可, 这里选择最小的一个
+        :param concept_triggers: 已经计算好的 concept_name => 必要关键词集合
+        :return: 返回关键词集合, None 表示无法确定
+        """
+        ret = None
+        for arg in self.args:
+            if arg.__class__.__name__ == 'RuleRangeArg':
+                continue
+            triggers = arg.find_triggers(concept_triggers)
+            if triggers is not None and (ret is None or len(triggers) < len(ret)):
+                ret = triggers
+        return ret
+
+    def structure(self):
+        """
+        用于判断子规则是否相同的结构: 规则类型和所有参数 (包括范围参数) 的结构
+        :return: 返回 tuple
+        """
+        return (self.__class__.__name__,) + tuple(arg.structure() for arg in self.args)
+
+    def compile(self, shared=None):
+        """
+        编译成匹配函数, 子节点的匹配函数和参数在编译时绑定, 匹配时不再遍历规则树.
+        默认为连接规则 (BagRule, OrdRule, SeqRule): 第一个参数是范围参数, 之后的参数需要全部结果,
+        任一参数没有结果则不可能命中, 否则使用 compose_result 连接
+        :param shared: 共享子规则的 SharedPlans 对象, 见 lre.plan, None 表示不共享
+        :return: 返回 match(text, limit=None) 函数
+        """
+        rule_range = self.args[0]
+        arg_matches = [compile_node(arg, shared) for arg in self.args[1:]]
+        compose_result = self.compose_result
+
+        def match(text, limit=None):
+            # 用来存放每个 arg 的匹配 Results
+            results_cache = []
+            for arg_match in arg_matches:
+                arg_results = arg_match(text)
+                if not arg_results:
+                    # 如果没有匹配到就返回空的 Results
+                    return EMPTY_RESULTS
+                results_cache.append(arg_results)
+            # 连接过程中已经使用范围参数过滤
+            return compose_result(text, rule_range, results_cache, limit)
+
+        return match
+
+    def match(self, text, limit=None):
+        """
+        匹配对象进行文本的规则匹配. 每次调用都会重新编译, 用于单独匹配一条规则,
+        概念中的规则在生成时已经编译, 见 Concept.compile
+        :param text: 待匹配的 Text 对象
+        :param limit: 需要的结果数目, 见 TextContext.match_concept. 连接规则的参数本身仍然需要全部结果
+        :return: 返回查找到的 Results 对象
+        """
+        return self.compile()(text, limit)
+
+    @staticmethod
+    def seed_groups(results, limit):
+        """
+        连接时首列结果的分组. limit 为 None 时所有首列结果作为一组, 一次连接完成;
+        否则按照起始 offset 分组, 每组单独连接. 有序连接的结果与首列结果的起始位置相同,
+        所以按组连接得到足够的结果即可停止, 此时已经包含了起始位置最早的 limit 个结果
+        :param results: 首列的 Results 对象
+        :param limit: 需要的结果数目, None 表示需要全部结果
+        :return: 返回 Result 列表的迭代器
+        """
+        if limit is None:
+            yield list(results)
+        else:
+            for group in BaseRule.group_by_beg(results):
+                yield group
+
+    @staticmethod
+    def group_by_beg(results):
+        """
+        按照起始 offset 分组
+        :param results: Results 对象
+        :return: 返回 Result 列表的迭代器, 每组的起始 offset 相同
+        """
+        group = []
+        for result in results:
+            if group and result.beg_index.offset != group[0].beg_index.offset:
+                yield group
+                group = []
+            group.append(result)
+        if group:
+            yield group
+
     def __str__(self):
         return '{0}(args=[{1}])'.format(
             self.__class__.__name__,
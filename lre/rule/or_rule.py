@@ -5,6 +5,7 @@
 from __future__ import unicode_literals
 
 from .base_rule import BaseRule
+from ..plan import compile_node
 from ..result import Results
 
 
@@ -36,18 +37,40 @@ class OrRule(BaseRule):
                     ', '.join(self.__class__.default_supported_arg_names)
                 ), index, arg_name)
 
-    def match(self, text):
+    def find_triggers(self, concept_triggers):
         """
-        匹配对象进行文本的规则匹配
-        :param text: 待匹配的 Text 对象
-        :return: 返回查找到的 Results 对象, 如果不存在返回 None
+        计算命中该规则的必要关键词集合 (至少出现其中一个), 任一参数命中即可, 所以取并集
+        :param concept_triggers: 已经计算好的 concept_name => 必要关键词集合
+        :return: 返回关键词集合, None 表示无法确定
         """
-        # 如果没有匹配到就返回一个空的 Results
-        results = Results()
-        # 用来存放每个 arg 的匹配 Results
+        ret = set()
         for arg in self.args:
-            arg_results = arg.match(text)
-            if len(arg_results) > 0:
-                results.add(arg_results)
+            triggers = arg.find_triggers(concept_triggers)
+            if triggers is None:
+                return None
+            ret.update(triggers)
+        return frozenset(ret)
 
-        return results
+    def compile(self, shared=None):
+        """
+        编译成匹配函数. 嵌套的 OrRule (需要共享的除外) 直接展开, 所有参数的结果合并到同一个 Results 中.
+        limit 不为 None 时每个参数都只需要最早的 limit 个结果, 合并后仍然包含全部结果中最早的 limit 个.
+        只判断是否命中时 (TextContext.any_hit) 按顺序匹配参数, 得到 limit 个结果即停止, 之后的参数不会计算
+        :param shared: 共享子规则的 SharedPlans 对象, 见 lre.plan, None 表示不共享
+        :return: 返回 match(text, limit=None) 函数
+        """
+        arg_matches = []
+        stack = list(reversed(self.args))
+        while stack:
+            arg = stack.pop()
+            if isinstance(arg, OrRule) and (shared is None or not shared.is_shared(arg)):
+                stack.extend(reversed(arg.args))
+            else:
+                arg_matches.append(compile_node(arg, shared))
+
+        def match(text, limit=None):
+            if limit is not None and text.any_hit:
+                return Results.union_until((arg_match(text, limit) for arg_match in arg_matches), limit)
+            return Results.union([arg_match(text, limit) for arg_match in arg_matches])
+
+        return match
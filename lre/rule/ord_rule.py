@@ -4,7 +4,9 @@
 """
 from __future__ import unicode_literals
 
-import copy
+from bisect import bisect_right
+
+import six
 
 from .base_rule import BaseRule
 from ..result import Result, Results
@@ -48,65 +50,59 @@ class OrdRule(BaseRule):
                     ', '.join(self.__class__.default_supported_arg_names)
                 ), index + 1, arg_name)
 
-    def recur_compose_result(self, results_cache, tmp_results, index, results):
-        """
-        递归来组合结果. 依据输入的每个 arg 对应的 Results, 通过 arg 的前后顺序进行筛选.
-        :param results_cache: 逐个 arg 对应的 Results 对象
-        :param tmp_results: 当前组合的已完成结果, 记录的是每个 arg 对应的一种 Result 情况
-        :param index: 当前计算的 results_cache 的索引号
-        :param results: 最终存放组合完毕的 Result (输出)
+    def compose_result(self, text, rule_range, results_cache, limit=None):
         """
-        if index == len(results_cache):  # 所有都运行完成
-            if len(tmp_results) == len(results_cache):  # 匹配的部分
-                # 所有 Result 的 bias 求和
-                total_bias = sum([result.bias for result in tmp_results])
-                # 重新生成一个 result
-                result = Result(
-                    self.config,
-                    tmp_results[0].word_list,
-                    tmp_results[0].beg_index,
-                    tmp_results[-1].end_index,
-                    total_bias
-                )
-                results.add(result)
-            return
-
-        if index == 0 and not tmp_results:  # 还没有数据
-            for result in results_cache[index]:  # 第一列
-                cur_results = copy.copy(tmp_results)
-                cur_results.append(result)
-                self.recur_compose_result(results_cache, cur_results, index + 1, results)
-        else:  # 非第一列 results
-            last_result = tmp_results[-1]
-            for result in results_cache[index]:  # 第 index 列
-                if last_result.end_index.offset < result.beg_index.offset:
-                    cur_results = copy.copy(tmp_results)
-                    cur_results.append(result)
-                    self.recur_compose_result(results_cache, cur_results, index + 1, results)
-
-    def match(self, text):
-        """
-        匹配对象进行文本的规则匹配
+        有序连接各个 arg 的结果. 每一步将下一列结果连接到部分结果之后:
+
+            1. 部分结果只记录 (起始 Index, 结束 Index, 累计 bias), 相同的部分结果只保留一份
+            2. 在按起始位置排序的结果中, 二分查找出起始位置在部分结果结束位置之后的第一个结果, 依次向后连接
+            3. 连接过程中使用范围参数判断, 超出范围的部分结果不会再继续连接
+
         :param text: 待匹配的 Text 对象
-        :return: 返回查找到的 Results 对象, 如果不存在返回 None
+        :param rule_range: 范围参数 RuleRangeArg 对象
+        :param results_cache: 逐个 arg 对应的 Results 对象
+        :param limit: 需要的结果数目, 得到足够的结果即停止连接, None 表示需要全部结果
+        :return: 返回连接完成的 Results 对象
         """
-        rule_range = self.args[0]
-        match_args = self.args[1:]
-        # 如果没有匹配到就返回一个空的 Results
         results = Results()
-        # 用来存放每个 arg 的匹配 Results
-        results_cache = []
-        for arg in match_args:
-            arg_results = arg.match(text)
-            if len(arg_results) == 0:
-                return results
-            else:
-                results_cache.append(arg_results)
+        for seeds in self.seed_groups(results_cache[0], limit):
+            # (beg offset, end offset, bias) => (beg_index, end_index, bias)
+            chains = {}
+            for result in seeds:
+                if rule_range.accept(result.beg_index, result.end_index, result.bias):
+                    key = (result.beg_index.offset, result.end_index.offset, result.bias)
+                    chains[key] = (result.beg_index, result.end_index, result.bias)
 
-        # 递归拼接结果
-        self.recur_compose_result(results_cache, [], 0, results)
+            for beg_index, end_index, bias in self.extend_chains(rule_range, chains, results_cache[1:]).values():
+                results.add(Result(self.config, text.word_list, beg_index, end_index, bias))
+            if limit is not None and len(results) >= limit:
+                break
+        return results
 
-        # 使用范围参数过滤
-        results = rule_range.filter(results)
+    def extend_chains(self, rule_range, chains, results_cache):
+        """
+        将部分结果依次与之后每一列结果连接
+        :param rule_range: 范围参数 RuleRangeArg 对象
+        :param chains: 首列的部分结果
+        :param results_cache: 之后每一列的 Results 对象
+        :return: 返回连接完成的部分结果
+        """
+        for arg_results in results_cache:
+            if not chains:
+                break
 
-        return results
+            # Results 本身按照起始位置排序
+            beg_offsets = arg_results.beg_offsets
+            next_chains = {}
+            for beg_index, end_index, bias in chains.values():
+                # 只有起始位置在 end_index 之后的结果才能连接
+                for i in six.moves.range(bisect_right(beg_offsets, end_index.offset), len(beg_offsets)):
+                    result = arg_results[i]
+                    if rule_range.out_of_range(beg_index, bias, result.beg_index):
+                        break
+                    chain_bias = bias + result.bias
+                    if rule_range.accept(beg_index, result.end_index, chain_bias):
+                        key = (beg_index.offset, result.end_index.offset, chain_bias)
+                        next_chains[key] = (beg_index, result.end_index, chain_bias)
+            chains = next_chains
+        return chains
@@ -43,7 +43,7 @@ class SyntaxParser(object):
 
     def __init__(self, config):
         self.config = config
-        self.nlp = Nlp(config)
+        self.nlp = Nlp.get(config)
 
     def match_comment(self, text, index):
         """
@@ -373,15 +373,44 @@ class SyntaxParser(object):
         else:
             raise ValueError('incomplete argument', text[index:])
 
+    @staticmethod
+    def locate(text, index):
+        """
+        计算索引在文本中的行号和列号
+        :param text: 全文本
+        :param index: 字符的索引号
+        :return: 返回 (行号, 列号), 均从 1 开始
+        """
+        line = text.count('\n', 0, index) + 1
+        column = index - (text.rfind('\n', 0, index) + 1) + 1
+        return line, column
+
     def parse(self, text):
         """
-        语法分析的入口位置
+        语法分析的入口位置. 语法错误抛出 ValueError, 会在参数末尾附上出错的位置 (行号和列号)
         :param text: 待分析的文本
         :return: 返回规则、过滤的列表以及概念过滤的列表
         """
+        stripped_text = text.strip()
+        try:
+            return self.parse_rules(stripped_text)
+        except ValueError as e:
+            # 语法错误的第 2 个参数起为出错位置开始的剩余文本, 依此计算出错的位置
+            for arg in e.args[1:]:
+                if isinstance(arg, six.string_types) and stripped_text.endswith(arg):
+                    index = len(text) - len(text.lstrip()) + len(stripped_text) - len(arg)
+                    line, column = self.locate(text, index)
+                    raise ValueError(*(e.args + ('line {0}, column {1}'.format(line, column),)))
+            raise
+
+    def parse_rules(self, text):
+        """
+        语法分析, 逐条解析规则和过滤
+        :param text: 待分析的文本, 已经去除首尾的空字符
+        :return: 返回规则、过滤的列表以及概念过滤的列表
+        """
         index = 0
         rules_filters = []
-        text = text.strip()
         while index < len(text):
             index = self.ignore_space(text, index)
 
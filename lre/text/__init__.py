@@ -1,2 +1,5 @@
 # -*- coding: utf-8 -*-
 from .text import Text
+from .text_context import TextContext
+from .text_view import TextView
+from .word_list import WordList
@@ -10,8 +10,10 @@ import six
 @six.python_2_unicode_compatible
 class Index(object):
     """
-    存储索引的对象, 同时包含部分简便操作, 所有的指标都不会被标点影响
+    存储索引的对象, 同时包含部分简便操作, 所有的指标都不会被标点影响.
+    每个词条都会生成一个 Index, 所以使用 __slots__ 减少内存占用, 生成后不可修改.
     """
+    __slots__ = ('i_para', 'i_sent', 'i_word', 'offset')
 
     def __init__(self, i_para, i_sent, i_word, offset):
         """
@@ -20,10 +22,17 @@ class Index(object):
         :param i_word: Term 所在词的 index
         :param offset: Term 在文章中的偏移量
         """
-        self.i_para = i_para
-        self.i_sent = i_sent
-        self.i_word = i_word
-        self.offset = offset
+        set_attr = object.__setattr__
+        set_attr(self, 'i_para', i_para)
+        set_attr(self, 'i_sent', i_sent)
+        set_attr(self, 'i_word', i_word)
+        set_attr(self, 'offset', offset)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Index is immutable', name)
+
+    def __reduce__(self):
+        return self.__class__, (self.i_para, self.i_sent, self.i_word, self.offset)
 
     @property
     def psw_index(self):
@@ -33,10 +42,20 @@ class Index(object):
         return self.i_para, self.i_sent, self.i_word
 
     def __eq__(self, other):
-        return self.i_para == other.i_para \
+        if not isinstance(other, Index):
+            return NotImplemented
+        return self.offset == other.offset \
+               and self.i_para == other.i_para \
                and self.i_sent == other.i_sent \
-               and self.i_word == other.i_word \
-               and self.offset == other.offset
+               and self.i_word == other.i_word
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    def __hash__(self):
+        # 同一个文本中 offset 唯一标识一个位置
+        return hash(self.offset)
 
     def __gt__(self, other):
         return self.psw_index > other.psw_index
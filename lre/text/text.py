@@ -4,11 +4,10 @@
 """
 from __future__ import unicode_literals
 
-from collections import defaultdict
-
 import six
 
 from .index import Index
+from .word_list import WordList
 from ..nlp import Nlp
 from ..result import Result, Results
 
@@ -18,42 +17,77 @@ class Text(object):
     """
     文档对象, 所有文档生成为文档对象后再进行处理.
     为了提高效率会生成两个关键词及其 Term 对象的映射表:
+
+    Text 只会被 append 修改, 匹配过程中的状态 (例如概念结果的缓存) 都存放在 TextContext 中,
+    规则也只会生成新的 Result/Results, 所以同一个 Text 可以被多次匹配, 也可以在多个线程中同时匹配
+    (append 不能与 match 同时进行).
     """
 
-    def __init__(self, config, text):
+    def __init__(self, config, text, para_base=0, offset_base=0, truncate=True):
         """
         :param config: 存储配置信息的对象
         :param text: 原始文本, 包含如下信息：
                          1. 段落使用 \n 分割
                          2. 句子使用标点符号分割
+        :param para_base: 第一个段落在整篇文档中的序号, 长文档分窗口时使用
+        :param offset_base: 第一个词条在整篇文档中的 offset, 长文档分窗口时使用
+        :param truncate: 是否将文本截断到 config.max_text_len
         """
         self.config = config
-        self.nlp = Nlp(config)
-        self.word_map, self.word_list = self.cut(text)
+        self.nlp = Nlp.get(config)
+        self.para_base = para_base
+        self.offset_base = offset_base
+        self.truncate = truncate
+        # 每个段落第一个词条的 offset, 最后额外加上结束位置 (即下一个段落的起始 offset)
+        self.para_offsets = [offset_base]
+        self.word_map = {}
+        self.word_list = WordList(base=offset_base)
+        self.cut(self.nlp.text2para(text or '', truncate))
 
-    def cut(self, text):
+    def cut(self, paragraphs):
         """
-        切分文本, 切分成段落-句子-词的结构
-        :param text: 待切分的文本
-        :return: 返回切分后的段落-句子-词的结构, 存储的格式为：
+        切分段落, 切分成段落-句子-词的结构, 追加到 word_list/word_map 的末尾. 存储的格式为：
             paragrapshs = [sentence_1, sentence_2, ...]
             sentence_n = [word_1, word_2, ...]
             word_n = (paragraph_index, sentence_index, word_index, word)
+        :param paragraphs: 待切分的段落列表
+        """
+        word_list = self.word_list
+        word_map = self.word_map
+        i_para = self.para_end
+        offset = self.para_offsets[-1]
+        for i_para, paragraph in enumerate(paragraphs, i_para):
+            for i_sent, sentence in enumerate(self.nlp.para2sent(paragraph)):
+                for i_word, word in enumerate(self.nlp.sent2word(sentence)):
+                    index = Index(i_para, i_sent, i_word, offset)
+                    offset += 1
+                    # 初始状态下 bias = 0
+                    word_list.append(word)
+                    result = Result(self.config, word_list, index, index, 0)
+                    # 普通 dict, 避免查找不存在的词时插入新的 key
+                    results = word_map.get(word)
+                    if results is None:
+                        results = word_map[word] = Results()
+                    results.add(result)
+            self.para_offsets.append(offset)
+
+    def append(self, text):
+        """
+        在文档末尾追加段落, 已有的词条不变, 新词条的结果按顺序追加到 word_map 中, 不截断.
+        用于不断增长的文档 (例如聊天记录), 之后可以通过 Model.match_append 只更新受影响的结果
+        :param text: 追加的文本, 可以包含多个段落 (以 \n 分割)
+        :return: 返回第一个追加的段落的序号
+        """
+        para_beg = self.para_end
+        self.cut(self.nlp.text2para(text, False))
+        return para_beg
+
+    @property
+    def para_end(self):
+        """
+        最后一个段落之后的段落序号
         """
-        word_list = []
-        word_map = defaultdict(Results)
-        if text:
-            offset = 0
-            for i_para, paragraph in enumerate(self.nlp.text2para(text)):
-                for i_sent, sentence in enumerate(self.nlp.para2sent(paragraph)):
-                    for i_word, word in enumerate(self.nlp.sent2word(sentence)):
-                        index = Index(i_para, i_sent, i_word, offset)
-                        offset += 1
-                        # 初始状态下 bias = 0
-                        word_list.append(word)
-                        result = Result(self.config, word_list, index, index, 0)
-                        word_map[word].add(result)
-        return word_map, word_list
+        return self.para_base + len(self.para_offsets) - 1
 
     def empty(self):
         """
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+匹配上下文, 一次匹配过程中对 Text 对象的包装
+"""
+from __future__ import unicode_literals
+
+import six
+
+from ..result import EMPTY_RESULTS
+
+
+@six.python_2_unicode_compatible
+class TextContext(object):
+    """
+    一次匹配过程 (一篇文档) 的上下文. 对 rule/arg 来说其用法和 Text 对象一致 (config, word_map, word_list),
+    同时缓存已经计算过的 Concept 结果, 保证每个概念在一篇文档中只会计算一次.
+
+    概念名称是在 match 的时候通过 concept_mgr 动态获取的, 所以不同模型 (或者同一模型的不同版本) 之间的缓存是隔离的.
+    """
+
+    def __init__(self, text, concept_mgr, any_hit=False):
+        """
+        :param text: 待匹配的 Text 对象
+        :param concept_mgr: 用来存储管理 concept_name => Concept 的对象
+        :param any_hit: 只需要部分结果 (limit 不为 None) 时, 是否任意 limit 个结果即可 (只判断是否命中时使用),
+                        否则需要最早的 limit 个结果. 为 True 时 $or 的分支和概念的规则得到足够的结果即停止
+        """
+        self.text = text
+        self.config = text.config
+        self.word_map = text.word_map
+        self.word_list = text.word_list
+        self.concept_mgr = concept_mgr
+        self.any_hit = any_hit
+        # 已经计算过的 concept_name => Results
+        self.concept_results = {}
+        # 只需要部分结果时计算过的 concept_name => (limit, Results), 不会作为全部结果使用
+        self.limited_results = {}
+        # 共享子规则的结果, 共享的编号 => Results 以及 (limit, Results), 见 lre.plan
+        self.shared_results = {}
+        self.limited_shared_results = {}
+        # 运行了规则的 concept 数目
+        self.evaluated_count = 0
+        # 因为不包含必要关键词而跳过的 concept 数目
+        self.pruned_count = 0
+
+    def __str__(self):
+        return 'TextContext(text={0}, cached={1})'.format(
+            self.text,
+            len(self.concept_results),
+        )
+
+    def match_concept(self, concept_name, limit=None):
+        """
+        获取概念在当前文档中的匹配结果, 第一次获取时计算, 之后直接使用缓存.
+        文档中不包含必要关键词的概念直接返回空结果, 不运行任何规则.
+        :param concept_name: 概念名称, 不存在则报错 KeyError
+        :param limit: 需要的结果数目, None 表示需要全部结果. 不为 None 时返回的结果至少包含全部结果中
+                      最早 (按 Results 的顺序) 的 limit 个, 可能更多; any_hit 为 True 时至少包含任意 limit 个.
+                      返回的结果少于 limit 个时一定是全部结果
+        :return: 返回匹配到的 Results 对象, 调用方不可修改
+        """
+        results = self.concept_results.get(concept_name)
+        if results is not None:
+            return results
+        if limit is not None:
+            cached = self.limited_results.get(concept_name)
+            if cached is not None and cached[0] >= limit:
+                return cached[1]
+
+        concept = self.concept_mgr.get(concept_name)
+        if concept.may_match(self):
+            results = concept.match(self, limit)
+            self.evaluated_count += 1
+        else:
+            results = EMPTY_RESULTS
+            self.pruned_count += 1
+
+        if limit is None or not results:  # 没有结果时也是全部结果
+            self.concept_results[concept_name] = results
+        else:
+            self.limited_results[concept_name] = (limit, results)
+        return results
+
+    def match_shared(self, shared_id, match, limit=None):
+        """
+        获取共享子规则在当前文档中的匹配结果, 第一次获取时计算, 之后直接使用缓存. 与 match_concept 的缓存方式相同
+        :param shared_id: 共享的编号
+        :param match: 子规则的匹配函数
+        :param limit: 需要的结果数目, 见 match_concept
+        :return: 返回匹配到的 Results 对象, 调用方不可修改
+        """
+        results = self.shared_results.get(shared_id)
+        if results is not None:
+            return results
+        if limit is not None:
+            cached = self.limited_shared_results.get(shared_id)
+            if cached is not None and cached[0] >= limit:
+                return cached[1]
+
+        results = match(self, limit)
+        if limit is None or not results:  # 没有结果时也是全部结果
+            self.shared_results[shared_id] = results
+        else:
+            self.limited_shared_results[shared_id] = (limit, results)
+        return results
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+文档末尾部分的视图, 用于增量匹配
+"""
+from __future__ import unicode_literals
+
+import six
+
+
+@six.python_2_unicode_compatible
+class TextView(object):
+    """
+    Text 从某个段落开始到末尾的部分. 对 rule/arg 来说其用法和 Text 对象一致 (config, word_map, word_list),
+    Index 仍然是整篇文档中的位置, 生成的代价只与这部分的长度有关 (关键词结果通过二分查找截取).
+    """
+
+    def __init__(self, text, para_beg):
+        """
+        :param text: Text 对象
+        :param para_beg: 起始段落的序号, 之前的段落不可见
+        """
+        self.text = text
+        self.config = text.config
+        self.word_list = text.word_list
+        self.para_beg = para_beg
+        self.beg_offset = text.para_offsets[para_beg - text.para_base]
+        end_offset = text.para_offsets[-1] - 1
+
+        self.word_map = {}
+        for word in set(text.word_list.span(self.beg_offset, end_offset)):
+            self.word_map[word] = text.word_map[word].slice_by_beg(self.beg_offset)
+
+    def __str__(self):
+        return 'TextView(text={0}, para_beg={1})'.format(self.text, self.para_beg)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+文档的词条列表
+"""
+from __future__ import unicode_literals
+
+import six
+
+from ..result import is_latin
+
+
+class WordList(list):
+    """
+    文档的词条列表, 即 Text.word_list. 本身就是一个 list, 另外记录第一个词条在整篇文档中的 offset (base),
+    长文档分窗口匹配时每个窗口只保存自己的词条, 但 Index.offset 仍然是整篇文档中的位置.
+
+    第一次拼接文本时一次性计算每个词条与前一个词条拼接的片段 (需要空格时以空格开头), 之后拼接一段文本
+    只需要一次切片和 join, 拼接过的文本按 (beg offset, end offset) 缓存.
+    已有的词条不会被修改, 所以追加词条后只需要计算新词条的片段, 缓存仍然有效.
+    """
+
+    def __init__(self, words=(), base=0):
+        """
+        :param words: 词条的列表
+        :param base: 第一个词条在整篇文档中的 offset
+        """
+        super(WordList, self).__init__(words)
+        self.base = base
+        # 与 list 中的词条一一对应的拼接片段, 只包含已经计算过的部分
+        self.pieces = []
+        # (beg offset, end offset) => 拼接后的文本
+        self.text_cache = {}
+
+    def __reduce__(self):
+        # 拼接片段和缓存在使用时重新生成
+        return self.__class__, (list(self), self.base)
+
+    def update_pieces(self):
+        """
+        计算还没有计算过的词条的拼接片段. 生成新的列表后再替换, 多个线程同时计算时结果相同
+        """
+        pieces = list(self.pieces)
+        beg = len(pieces)
+        # word => (第一个字符是否是拉丁字母, 最后一个字符是否是拉丁字母), 文档中的词条大量重复
+        flags = {}
+        # 前一个词条的最后一个字符是否是拉丁字母
+        prev_tail = beg > 0 and is_latin(self[beg - 1][-1])
+        for i in six.moves.range(beg, len(self)):
+            word = self[i]
+            flag = flags.get(word)
+            if flag is None:
+                flag = flags[word] = (is_latin(word[0]), is_latin(word[-1]))
+            # 与 Result.zh_join 一致, 只看前一个词的最后一个字符和后一个词的第一个字符
+            pieces.append(' ' + word if i > 0 and (prev_tail or flag[0]) else word)
+            prev_tail = flag[1]
+        self.pieces = pieces
+
+    def span(self, beg_offset, end_offset):
+        """
+        获取 offset 在 [beg_offset, end_offset] 范围内的词条
+        :param beg_offset: 起始 offset (闭区间)
+        :param end_offset: 结束 offset (闭区间)
+        :return: 返回词条的列表
+        """
+        return self[beg_offset - self.base: end_offset - self.base + 1]
+
+    def join(self, beg_offset, end_offset):
+        """
+        拼接 offset 在 [beg_offset, end_offset] 范围内的词条, 与 Result.zh_join(self.span(beg_offset, end_offset)) 相同
+        :param beg_offset: 起始 offset (闭区间)
+        :param end_offset: 结束 offset (闭区间)
+        :return: 返回拼接后的文本
+        """
+        key = (beg_offset, end_offset)
+        text = self.text_cache.get(key)
+        if text is None:
+            beg = beg_offset - self.base
+            end = end_offset - self.base + 1
+            if len(self.pieces) < end:
+                self.update_pieces()
+            if beg >= end:
+                text = ''
+            else:
+                # 第一个词条之前不需要空格
+                text = self[beg] + ''.join(self.pieces[beg + 1:end])
+            self.text_cache[key] = text
+        return text
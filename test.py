@@ -1,12 +1,24 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import itertools
 import os
+import random
+import shutil
+import tempfile
+import threading
 import unittest
 
 import six
+from six.moves import cPickle as pickle
 
+import lre.model
 from lre import Config, Model, Text
+from lre.cache import LRUCache
+from lre.nlp import Nlp
+from lre.result import Result, Results
+from lre.rule import BagRule
+from lre.text import TextContext
 
 if six.PY2:
     from codecs import open
@@ -15,6 +27,133 @@ config = Config(force_concept_size_one=False)
 config_concept_size_one = Config(force_concept_size_one=True)
 
 
+def make_rule_dir(rules):
+    """
+    生成一个临时的规则目录
+    :param rules: {concept_name: 规则文本} 的 dict
+    :return: 返回规则目录的路径, 使用完需要删除
+    """
+    rule_dir_path = tempfile.mkdtemp()
+    for concept_name, rule in rules.items():
+        file_path = os.path.join(rule_dir_path, '{0}.cpt'.format(concept_name))
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(rule)
+    return rule_dir_path
+
+
+def dump(results_iter):
+    """
+    把匹配结果转成便于比较的 dict
+    :param results_iter: {concept_name: Results} 的 dict
+    :return: 返回 {concept_name: [(文本, key, psw_index)]} 的 dict
+    """
+    return dict((k, [(six.text_type(x), x.key, x.beg_index.psw_index) for x in v])
+                for k, v in results_iter.items())
+
+
+def random_texts(seed, count=15, size=24):
+    """
+    生成包含多个段落和句子的随机文本, 用于和参照实现对比
+    :param seed: 随机种子
+    :param count: 文本数目
+    :param size: 每个文本的词条数目
+    :return: 返回文本的列表
+    """
+    rand = random.Random(seed)
+    vocab = ['好', '好', '很', '快递', '赞', '不', '，', '。', '。', '\n']
+    return [''.join(rand.choice(vocab) for _ in range(size)) for _ in range(count)]
+
+
+def naive_join(rule_range, columns, compose):
+    """
+    连接的参照实现: 枚举各参数结果的笛卡尔积, 用 compose 组合后再用范围参数判断
+    :param rule_range: 范围参数 RuleRangeArg 对象
+    :param columns: 各个参数的匹配结果
+    :param compose: 组合函数, 输入一组结果, 返回 (起始 Index, 结束 Index, bias), 不能组合时返回 None
+    :return: 返回去重并排序后的结果 key 列表
+    """
+    keys = set()
+    for combination in itertools.product(*columns):
+        composed = compose(combination)
+        if composed is not None and rule_range.accept(*composed):
+            beg_index, end_index, bias = composed
+            keys.add((beg_index.offset, end_index.offset, bias))
+    return sorted(keys)
+
+
+def naive_ord(combination):
+    """
+    有序组合的参照实现: 每个结果都在后一个结果开始之前结束
+    """
+    for prev, curr in zip(combination, combination[1:]):
+        if prev.end_index.offset >= curr.beg_index.offset:
+            return None
+    return combination[0].beg_index, combination[-1].end_index, sum(x.bias for x in combination)
+
+
+def naive_seq(combination):
+    """
+    连续组合的参照实现: 每个结果都紧接着前一个结果
+    """
+    for prev, curr in zip(combination, combination[1:]):
+        if prev.end_index.offset + 1 != curr.beg_index.offset:
+            return None
+    return combination[0].beg_index, combination[-1].end_index, sum(x.bias for x in combination)
+
+
+def naive_bag(combination):
+    """
+    无序组合的参照实现: 各个结果之间没有重叠, 范围为最靠前的起始位置到最靠后的结束位置
+    """
+    covered = set()
+    for result in combination:
+        offsets = set(range(result.beg_index.offset, result.end_index.offset + 1))
+        if covered & offsets:
+            return None
+        covered |= offsets
+    beg_index = min((x.beg_index for x in combination), key=lambda x: x.offset)
+    end_index = max((x.end_index for x in combination), key=lambda x: x.offset)
+    return beg_index, end_index, sum(x.bias for x in combination)
+
+
+# 过滤范围单位 => (两个 Index 是否在同一个范围内, Index 在该单位下的位置)
+NAIVE_FILTER_UNITS = {
+    'd': (lambda a, b: (a.i_para, a.i_sent) == (b.i_para, b.i_sent), lambda x: x.i_word),
+    'w': (lambda a, b: a.i_para == b.i_para, lambda x: x.offset),
+    's': (lambda a, b: a.i_para == b.i_para, lambda x: x.i_sent),
+    'p': (lambda a, b: True, lambda x: x.i_para),
+    't': (lambda a, b: True, lambda x: x.offset),
+}
+
+
+def naive_filtered(filter_range, target_result, filter_results):
+    """
+    过滤的参照实现: 逐个比较过滤结果与目标结果
+    :param filter_range: 过滤范围 FilterRangeArg 对象
+    :param target_result: 待过滤的目标结果
+    :param filter_results: 过滤规则的匹配结果
+    :return: 返回是否过滤
+    """
+    target_beg, target_end = target_result.beg_index, target_result.end_index
+    for result in filter_results:
+        if filter_range.forward_n > 0:
+            same, pos = NAIVE_FILTER_UNITS[filter_range.forward_unit]
+            n = float('inf') if filter_range.forward_unit == 't' else filter_range.forward_n
+            if same(result.end_index, target_beg) \
+                    and pos(target_beg) > pos(result.end_index) >= pos(target_beg) - n:
+                return True
+        if filter_range.backward_n > 0:
+            same, pos = NAIVE_FILTER_UNITS[filter_range.backward_unit]
+            n = float('inf') if filter_range.backward_unit == 't' else filter_range.backward_n
+            if same(result.beg_index, target_end) \
+                    and pos(target_end) < pos(result.beg_index) <= pos(target_end) + n:
+                return True
+        if filter_range.is_overlap:
+            if result.beg_index.offset <= target_end.offset and target_beg.offset <= result.end_index.offset:
+                return True
+    return False
+
+
 class TestCase(unittest.TestCase):
     """
     测试 case
@@ -87,11 +226,828 @@ class TestCase(unittest.TestCase):
                 else:
                     raise ValueError('invalid concept name')
 
+    def test_concept_graph(self):
+        """
+        测试概念依赖关系的检查, 悬空引用和循环引用在训练时报错
+        """
+        rule_dir_path = make_rule_dir({
+            'A': '$arg(%B)',
+            'B': '$ord(@d3, "好", %A)',
+        })
+        try:
+            with self.assertRaises(ValueError):
+                Model.train(config, rule_dir_path)
+        finally:
+            shutil.rmtree(rule_dir_path)
+
+        rule_dir_path = make_rule_dir({
+            'A': '$arg(%Missing)',
+        })
+        try:
+            with self.assertRaises(ValueError):
+                Model.train(config, rule_dir_path)
+        finally:
+            shutil.rmtree(rule_dir_path)
+
+        rule_dir_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)),
+            'test_data/rules'
+        )
+        model = Model.train(config, rule_dir_path)
+        order = model.concept_mgr.order
+        self.assertLess(order.index('好'), order.index('安装好'))
+        self.assertLess(order.index('好'), order.index('快递好'))
+
+        # 只计算 安装好 及其依赖
+        text = Text(config, '安装师傅细心专业, 五星好评')
+        results_iter = model.match(text, lambda x: x != '安装好')
+        self.assertEqual(list(results_iter.keys()), ['安装好'])
+
+    def test_concept_cache(self):
+        """
+        测试同一篇文档中被多个概念引用的概念只计算一次, 结果与单独匹配一致
+        """
+        rule_dir_path = make_rule_dir({
+            'A': '$arg("好")\n',
+            'B': '$ord(@d3, "很", %A)\n',
+            'C': '$ord(@d3, %A, "评")\n',
+        })
+        try:
+            model = Model.train(config, rule_dir_path)
+            text = Text(config, '很好, 好评')
+
+            stats = {}
+            concept_results = model.match(text, stats=stats)
+            self.assertEqual(sorted(concept_results.keys()), ['A', 'B', 'C'])
+            # A 被 B 和 C 引用, 但只计算一次
+            self.assertEqual(stats, {'evaluated': 3, 'pruned': 0})
+
+            context = TextContext(text, model.concept_mgr)
+            results = context.match_concept('A')
+            context.match_concept('B')
+            context.match_concept('C')
+            self.assertIs(context.match_concept('A'), results)
+            self.assertEqual(context.evaluated_count, 3)
+
+            # 不共享缓存, 每个概念单独匹配的结果相同
+            for concept_name, results in concept_results.items():
+                self.assertEqual([x.key for x in model.concept_mgr.get(concept_name).match(text)],
+                                 [x.key for x in results])
+        finally:
+            shutil.rmtree(rule_dir_path)
+
+    def test_prune_concepts(self):
+        """
+        测试不包含必要关键词的概念会被跳过
+        """
+        rule_dir_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)),
+            'test_data/rules'
+        )
+        model = Model.train(config, rule_dir_path)
+        self.assertEqual(model.concept_mgr.get('安装好').triggers, frozenset(['安']))
+
+        stats = {}
+        results_iter = model.match(Text(config, '快递很给力'), stats=stats)
+        self.assertEqual(sorted(results_iter.keys()), ['好', '快递好'])
+        self.assertEqual(stats, {'evaluated': 2, 'pruned': 1})
+
+        stats = {}
+        results_iter = model.match(Text(config, '没有任何命中'), stats=stats)
+        self.assertEqual(results_iter, {})
+        self.assertEqual(stats, {'evaluated': 0, 'pruned': 3})
+
+    def test_text_reuse(self):
+        """
+        测试同一个 Text 多次匹配以及多线程同时匹配, 结果一致且不会修改 Text
+        """
+        rule_dir_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)),
+            'test_data/rules'
+        )
+        model = Model.train(config_concept_size_one, rule_dir_path)
+
+        text_file_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)),
+            'test_data/text.txt'
+        )
+        with open(text_file_path, encoding='utf-8') as f:
+            text = Text(config_concept_size_one, f.read())
+
+        expected = dump(model.match(text))
+        self.assertEqual(dump(model.match(text)), expected)
+        # 概念的 bias 不会写回 Text 中的 Result
+        for result in text.word_map['好']:
+            self.assertEqual(result.bias, 0)
+
+        outputs = []
+
+        def run():
+            outputs.append(dump(model.match(text)))
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(outputs, [expected] * 4)
+
+    def test_match_many(self):
+        """
+        测试多进程批量匹配, 结果与逐个匹配一致
+        """
+        rule_dir_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)),
+            'test_data/rules'
+        )
+        model = Model.train(config, rule_dir_path)
+
+        text_file_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)),
+            'test_data/text.txt'
+        )
+        with open(text_file_path, encoding='utf-8') as f:
+            texts = [x for x in f.read().split('，') if x]
+
+        expected = [(i, dump(model.match(x))) for i, x in enumerate(texts)]
+        outputs = [(i, dump(x)) for i, x in model.match_many(texts, workers=2)]
+        self.assertEqual(outputs, expected)
+        outputs = [(i, dump(x)) for i, x in model.match_many(texts, workers=2, ordered=False)]
+        self.assertEqual(sorted(outputs), expected)
+
+    def test_save_load(self):
+        """
+        测试保存和加载编译好的模型
+        """
+        rule_dir_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)),
+            'test_data/rules'
+        )
+        model = Model.train(config, rule_dir_path)
+
+        text_file_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)),
+            'test_data/text.txt'
+        )
+        with open(text_file_path, encoding='utf-8') as f:
+            text = f.read()
+
+        model_dir_path = tempfile.mkdtemp()
+        try:
+            model_path = os.path.join(model_dir_path, 'model.bin')
+            model.save(model_path)
+
+            loaded_model = Model.load(model_path)
+            # 加载时不编译, 概念在第一次匹配时才编译
+            self.assertTrue(all(x.rule_matches is None for x in loaded_model.concept_mgr.values()))
+            self.assertEqual(loaded_model.concept_mgr.share_stats, model.concept_mgr.share_stats)
+            self.assertEqual(dump(loaded_model.match(text)), dump(model.match(text)))
+            self.assertTrue(all(x.rule_matches is not None for x in loaded_model.concept_mgr.values()))
+            loaded_model = Model.load(model_path, Config(force_concept_size_one=False, max_text_len=100))
+            self.assertEqual(loaded_model.config.max_text_len, 100)
+
+            with self.assertRaises(ValueError):
+                Model.load(model_path, config_concept_size_one)
+        finally:
+            shutil.rmtree(model_dir_path)
+
+    def test_train_workers(self):
+        """
+        测试多进程编译规则, 以及编译错误包含文件和行号
+        """
+        rule_dir_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)),
+            'test_data/rules'
+        )
+        model = Model.train(config, rule_dir_path, workers=2)
+        self.assertEqual(sorted(model.concept_mgr.keys()), ['好', '安装好', '快递好'])
+        # 当前进程中编译时不会留下子进程使用的语法分析器
+        Model.train(config, rule_dir_path)
+        self.assertIsNone(lre.model._worker_syntax_parser)
+
+        text = Text(config, '安装师傅细心专业, 快递给力')
+        expected = Model.train(config, rule_dir_path).match(text)
+        results_iter = model.match(text)
+        self.assertEqual(
+            dict((k, list(v)) for k, v in results_iter.items()),
+            dict((k, list(v)) for k, v in expected.items()),
+        )
+
+        rule_dir_path = make_rule_dir({
+            'A': '$arg("好")\n$ord(@d3, "好" "坏")\n',
+        })
+        try:
+            with self.assertRaises(ValueError) as cm:
+                Model.train(config, rule_dir_path, workers=2)
+            self.assertTrue(cm.exception.args[0].endswith('A.cpt'))
+            self.assertEqual(cm.exception.args[-1], 'line 2, column 11')
+        finally:
+            shutil.rmtree(rule_dir_path)
+
+    def test_reload(self):
+        """
+        测试增量加载修改过的规则文件
+        """
+        rule_dir_path = make_rule_dir({
+            'A': '$arg("安装")\n',
+            'B': '$ord(@d5, %A, "师傅")\n',
+            'C': '$arg("快递")\n',
+        })
+        try:
+            model = Model.train(config, rule_dir_path)
+            text = Text(config, '安装师傅细心专业, 快递给力, 物流很快')
+            self.assertEqual(sorted(model.match(text).keys()), ['A', 'B', 'C'])
+            old_mgr = model.concept_mgr
+
+            # 没有修改时不替换
+            self.assertEqual(model.reload(rule_dir_path), {'added': [], 'changed': [], 'removed': []})
+            self.assertIs(model.concept_mgr, old_mgr)
+            self.assertEqual(model.version, 0)
+
+            with open(os.path.join(rule_dir_path, 'A.cpt'), 'w', encoding='utf-8') as f:
+                f.write('$arg("物流")\n')
+            with open(os.path.join(rule_dir_path, 'D.cpt'), 'w', encoding='utf-8') as f:
+                f.write('$arg("给力")\n')
+            os.remove(os.path.join(rule_dir_path, 'C.cpt'))
+            self.assertEqual(model.reload(rule_dir_path), {'added': ['D'], 'changed': ['A'], 'removed': ['C']})
+            self.assertEqual(model.version, 1)
+
+            # 未修改的 B 复用编译好的规则和匹配函数, 修改的 A 在第一次匹配时才编译, 旧的概念图不受影响
+            self.assertIs(model.concept_mgr.get('B').rules_filters, old_mgr.get('B').rules_filters)
+            self.assertIs(model.concept_mgr.get('B').rule_matches, old_mgr.get('B').rule_matches)
+            self.assertIsNone(model.concept_mgr.get('A').rule_matches)
+            self.assertIs(old_mgr.get('B').concept_mgr, old_mgr)
+            self.assertEqual(sorted(old_mgr.match(text).keys()), ['A', 'B', 'C'])
+            self.assertEqual(sorted(model.match(text).keys()), ['A', 'D'])
+
+            # 出错时保持原来的模型
+            os.remove(os.path.join(rule_dir_path, 'A.cpt'))
+            new_mgr = model.concept_mgr
+            with self.assertRaises(ValueError):
+                model.reload(rule_dir_path)
+            self.assertIs(model.concept_mgr, new_mgr)
+            self.assertEqual(model.version, 1)
+        finally:
+            shutil.rmtree(rule_dir_path)
+
+    def test_reload_shared(self):
+        """
+        测试增量加载后不再共享的子规则被丢弃, 共享的编号不会重复使用
+        """
+        rule_dir_path = make_rule_dir({
+            'A': '$ord(@d2, $or("不", "没"), "好")\n',
+            'B': '$ord(@d2, $or("不", "没"), "快")\n',
+        })
+        try:
+            model = Model.train(config, rule_dir_path)
+            text = Text(config, '不好。没快')
+            self.assertEqual([x.text for x in model.match(text)['B']], ['没快'])
+            key = model.concept_mgr['A'].rules_filters[0].args[1].structure()
+            shared_plans = model.concept_mgr.shared_plans
+            old_id = shared_plans.ids[key]
+            self.assertIn(old_id, shared_plans.matches)
+
+            # B 不再引用, 共享的子规则连同匹配函数一起丢弃, 复用的 A 仍然可以使用编译好的匹配函数
+            with open(os.path.join(rule_dir_path, 'B.cpt'), 'w', encoding='utf-8') as f:
+                f.write('$arg("快")\n')
+            model.reload(rule_dir_path)
+            shared_plans = model.concept_mgr.shared_plans
+            self.assertEqual(shared_plans.ids, {})
+            self.assertEqual(shared_plans.matches, {})
+            concept_results = model.match(text)
+            self.assertEqual([x.text for x in concept_results['A']], ['不好'])
+            self.assertEqual([x.text for x in concept_results['B']], ['快'])
+
+            # 再次共享时使用新的编号
+            with open(os.path.join(rule_dir_path, 'B.cpt'), 'w', encoding='utf-8') as f:
+                f.write('$ord(@d2, $or("不", "没"), "快")\n')
+            model.reload(rule_dir_path)
+            self.assertNotEqual(model.concept_mgr.shared_plans.ids[key], old_id)
+            concept_results = model.match(text)
+            self.assertEqual([x.text for x in concept_results['A']], ['不好'])
+            self.assertEqual([x.text for x in concept_results['B']], ['没快'])
+
+            loaded_model = pickle.loads(pickle.dumps(model))
+            self.assertEqual(loaded_model.concept_mgr.shared_plans.ids, model.concept_mgr.shared_plans.ids)
+            self.assertEqual(loaded_model.concept_mgr.shared_plans.next_id, model.concept_mgr.shared_plans.next_id)
+        finally:
+            shutil.rmtree(rule_dir_path)
+
+    def test_fast_char_cut(self):
+        """
+        测试字符级别的快速切分与 jieba 切分的结果一致, 以及默认使用 jieba 切分
+        """
+        text_file_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)),
+            'test_data/text.txt'
+        )
+        with open(text_file_path, encoding='utf-8') as f:
+            lines = f.read().split('\n')
+        lines += ['iPhone12很好用', '3.5分, 价格123元', 'abc123def x.y 12abc', '好_好 １２３ café很棒']
+        # 依赖 jieba 词典的情况, 快速切分的结果不同
+        jieba_only_lines = ['T恤', 'B超', 'X光', 'U盘', 'C++', '1,000元']
+
+        fast_config = Config(force_concept_size_one=False, fast_char_cut=True)
+        nlp = Nlp.get(config).nlp
+        for line in lines:
+            self.assertEqual(Text(fast_config, line).word_list, Text(config, line).word_list)
+        for line in lines + jieba_only_lines:
+            self.assertEqual(Text(config, line).word_list, list(nlp.sent2word_jieba(line)))
+        self.assertEqual(list(nlp.sent2word_jieba('T恤')), ['T', '恤'])
+        self.assertEqual(list(Nlp.get(fast_config).nlp.sent2char('T恤')), ['t', '恤'])
+
+    def test_shared_nlp(self):
+        """
+        测试同一配置共享分词对象, 以及预加载
+        """
+        nlp_list = []
+        threads = [
+            threading.Thread(target=lambda: nlp_list.append(Nlp.get(Config(word_level='word'))))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(id(x) for x in nlp_list)), 1)
+        self.assertIsNot(nlp_list[0], Nlp.get(config))
+        self.assertIs(Text(config, '好评').nlp, Nlp.get(Config(force_concept_size_one=False)))
+
+        rule_dir_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)),
+            'test_data/rules'
+        )
+        model = Model.train(Config(word_level='word'), rule_dir_path)
+        model.warmup()
+        self.assertIn('好', model.match('快递很给力').keys())
+
+    def test_result_cache(self):
+        """
+        测试文档结果缓存
+        """
+        rule_dir_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)),
+            'test_data/rules'
+        )
+        model = Model.train(Config(force_concept_size_one=False, result_cache_size=100), rule_dir_path)
+        text = '安装师傅细心专业, 快递给力'
+
+        stats = {}
+        expected = model.match(text, stats=stats)
+        self.assertFalse(stats['cached'])
+        stats = {}
+        self.assertEqual(model.match(text, stats=stats), expected)
+        self.assertTrue(stats['cached'])
+
+        # 请求的概念不同时不共用缓存
+        stats = {}
+        results_iter = model.match(text, lambda x: x != '快递好', stats)
+        self.assertFalse(stats['cached'])
+        self.assertEqual(list(results_iter.keys()), ['快递好'])
+        self.assertEqual(model.result_cache.stats()['hits'], 1)
+        self.assertEqual(model.result_cache.stats()['misses'], 2)
+
+        # 缓存不会被序列化
+        loaded_model = pickle.loads(pickle.dumps(model))
+        self.assertEqual(len(loaded_model.result_cache), 0)
+
+        now = [0]
+        cache = LRUCache(3, ttl=10, weigh=len, clock=lambda: now[0])
+        cache.put('a', 'x')
+        cache.put('b', 'yy')
+        self.assertEqual(cache.get('a'), 'x')
+        cache.put('c', 'z')  # 淘汰最久没有使用的 b
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 'z')
+        now[0] = 10
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['expirations'], 1)
+        self.assertEqual(len(cache), 1)
+
+    def test_sent_cache(self):
+        """
+        测试句子切分结果缓存
+        """
+        cache_config = Config(force_concept_size_one=False, word_level='word', sent_cache_size=10)
+        no_cache_config = Config(force_concept_size_one=False, word_level='word')
+        text = '亲，欢迎光临！物流很快。亲，欢迎光临！'
+        self.assertEqual(Text(cache_config, text).word_list, Text(no_cache_config, text).word_list)
+        Text(cache_config, text)
+
+        stats = Nlp.get(cache_config).sent_cache.stats()
+        self.assertEqual(stats['items'], 3)
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['hits'], 5)
+        self.assertIsNone(Nlp.get(no_cache_config).sent_cache)
+
+    def test_match_long(self):
+        """
+        测试长文档分窗口匹配
+        """
+        rule_dir_path = make_rule_dir({
+            'A': '$arg("好")\n',
+            'B': '$ord(@p2, "快递", %A)\n',
+            'C': '$or(!filt($arg(%A), @[p1, 0, 0], "差"), "赞")\n',
+            # @t 范围不影响其他概念的窗口
+            'D': '$ord(@t1, "一般", "赞")\n',
+            'E': '$arg(%D)\n',
+        })
+        try:
+            model = Model.train(Config(force_concept_size_one=False, max_text_len=10), rule_dir_path)
+            self.assertEqual(model.concept_mgr.para_margin, 4)
+            self.assertEqual(model.concept_mgr.text_scope_concepts, frozenset(['D', 'E']))
+            full_model = Model.train(Config(force_concept_size_one=False, max_text_len=100000), rule_dir_path)
+
+            paragraphs = ['快递很快', '质量好', '差', '好', '一般般', '很好', '赞'] * 20
+            text = '\n'.join(paragraphs)
+
+            expected = dump(full_model.match(text, lambda x: x in 'DE'))
+            self.assertEqual(len(expected['B']), 20)
+            self.assertEqual(len(expected['C']), 20 * 3)
+            self.assertEqual(dump(model.match_long(text, lambda x: x in 'DE')), expected)
+            results_iter = model.match_long(iter(paragraphs), window_len=1)
+            self.assertEqual(sorted(results_iter.keys()), ['A', 'B', 'C', 'D', 'E'])
+            self.assertEqual(dict((k, v) for k, v in dump(results_iter).items() if k not in 'DE'), expected)
+            # 普通匹配会截断
+            self.assertLess(len(model.match(text)['A']), len(expected['A']))
+        finally:
+            shutil.rmtree(rule_dir_path)
+
+    def test_match_append(self):
+        """
+        测试追加段落和增量匹配
+        """
+        rule_dir_path = make_rule_dir({
+            'A': '$arg("好")\n',
+            'B': '$ord(@p2, "快递", %A)\n',
+            'C': '$or(!filt($arg(%A), @[p1, 0, 0], "差"), "赞")\n',
+        })
+        try:
+            model = Model.train(Config(force_concept_size_one=False), rule_dir_path)
+            paragraphs = ['快递很快', '质量好', '差', '好', '一般般', '很好, 快递', '赞']
+
+            text = Text(config, paragraphs[0])
+            concept_results = model.match(text)
+            for i, paragraph in enumerate(paragraphs[1:], 1):
+                self.assertEqual(text.append(paragraph), i)
+                model.match_append(text, concept_results, i)
+                self.assertEqual(dump(concept_results), dump(model.match(text)))
+
+            full_text = Text(config, '\n'.join(paragraphs))
+            self.assertEqual(text.word_list, full_text.word_list)
+            self.assertEqual(text.para_offsets, full_text.para_offsets)
+            self.assertEqual(dump(concept_results), dump(model.match(full_text)))
+        finally:
+            shutil.rmtree(rule_dir_path)
+
+    def test_exists_mode(self):
+        """
+        测试只判断是否命中的匹配模式
+        """
+        rule_dir_path = make_rule_dir({
+            'A': '$arg("好")\n',
+            'B': '$ord(@p2, "快递", %A)\n',
+            'C': '$or(!filt($arg(%A), @[p1, 0, 0], "差"), "赞")\n',
+            'D': '$arg("差评")\n',
+        })
+        try:
+            model = Model.train(Config(force_concept_size_one=False), rule_dir_path)
+            text = Text(config, '快递很快\n质量好\n差\n好\n很好, 快递')
+            full_results = model.match(text)
+            exists_results = model.match(text, mode='exists')
+            self.assertEqual(sorted(exists_results.keys()), sorted(full_results.keys()))
+            for name, results in exists_results.items():
+                self.assertEqual(len(results), 1)
+                self.assertIn(results[0].key, [x.key for x in full_results[name]])
+
+            self.assertEqual(model.any_match(text, ['D', 'C', 'B']), 'C')
+            self.assertIsNone(model.any_match(text, ['D']))
+            self.assertIsNone(model.any_match(Text(config, '一般般')))
+            self.assertRaises(ValueError, model.match, text, mode='first')
+        finally:
+            shutil.rmtree(rule_dir_path)
+
+    def test_exists_short_circuit(self):
+        """
+        测试只判断是否命中时, $or 前面的分支或者概念前面的规则命中之后, 后面的不再计算
+        """
+        rule_dir_path = make_rule_dir({
+            'A': '$or("好", $bag(@t1, "很", "赞", "很"))\n',
+            'B': '$arg("好")\n$bag(@t1, "很", "赞", "很")\n',
+            'C': '$or(!filt($or("赞", "好"), @[d3, 0, 0], "不"), $bag(@t1, "很", "赞", "很"))\n',
+        })
+        calls = []
+        compose_result = vars(BagRule)['compose_result']
+
+        def counted_compose_result(rule, *args, **kwargs):
+            calls.append(rule)
+            return compose_result(rule, *args, **kwargs)
+
+        BagRule.compose_result = counted_compose_result
+        try:
+            model = Model.train(Config(force_concept_size_one=False), rule_dir_path)
+            text = Text(config, '不，赞。好很赞很')
+            self.assertEqual(model.any_match(text, ['A']), 'A')
+            self.assertEqual(model.any_match(text, ['B']), 'B')
+            self.assertEqual(model.any_match(text, ['C']), 'C')
+            exists_results = model.match(text, mode='exists')
+            self.assertEqual(calls, [])
+
+            # 过滤掉第一个分支的结果后, 仍然能从后面的分支找到结果
+            self.assertEqual([x.text for x in exists_results['C']], ['好'])
+
+            full_results = model.match(text)
+            self.assertGreater(len(calls), 0)
+            self.assertEqual(sorted(exists_results.keys()), sorted(full_results.keys()))
+            for name, results in exists_results.items():
+                self.assertIn(results[0].key, [x.key for x in full_results[name]])
+        finally:
+            BagRule.compose_result = compose_result
+            shutil.rmtree(rule_dir_path)
+
+    def test_top_mode(self):
+        """
+        测试只返回最早的若干个结果的匹配模式
+        """
+        rule_dir_path = make_rule_dir({
+            'A': '$arg("好")\n',
+            'B': '$ord(@s2, "好", "好")\n',
+            'C': '$bag(@s2, "赞", "好")\n',
+            'D': '$or(!filt($arg(%B), @[d1, 0, 0], "差"), "赞")\n',
+        })
+        try:
+            model = Model.train(Config(force_concept_size_one=False), rule_dir_path)
+            text = Text(config, '好好赞好。差好好赞好')
+            full_results = model.match(text)
+            for top_k in (1, 2, 5):
+                top_results = model.match(text, mode='top', top_k=top_k)
+                self.assertEqual(sorted(top_results.keys()), sorted(full_results.keys()))
+                for name, results in top_results.items():
+                    self.assertEqual([x.key for x in results], [x.key for x in full_results[name]][:top_k])
+
+            self.assertRaises(ValueError, model.match, text, mode='count')
+            self.assertRaises(ValueError, model.match, text, mode='top')
+            self.assertRaises(ValueError, model.match, text, mode='top', top_k=0)
+        finally:
+            shutil.rmtree(rule_dir_path)
+
+    def test_result_text(self):
+        """
+        测试结果文本的拼接和缓存
+        """
+        text = Text(config, '我的iPhone手机, 推荐 iPad 2')
+        words = text.word_list
+        for beg in range(len(words)):
+            for end in range(beg, len(words)):
+                expected = Result.zh_join(words.span(beg, end))
+                self.assertEqual(words.join(beg, end), expected)
+        self.assertIs(words.join(0, 3), words.join(0, 3))
+
+        text.append('好用iPad')
+        result = text.word_map['ipad'][-1]
+        self.assertEqual(result.text, 'ipad')
+        self.assertEqual(words.join(0, len(words) - 1), Result.zh_join(list(words)))
+
+    def test_compiled_plan(self):
+        """
+        测试编译后的规则匹配函数
+        """
+        rule_dir_path = make_rule_dir({
+            'A': '$arg("好")\n!cfilt(@[d1, 0, 0], $arg("不"))\n',
+            'B': '$or($or("很", %A), $arg("赞"))\n',
+        })
+        try:
+            model = Model.train(Config(force_concept_size_one=False), rule_dir_path)
+            text = Text(config, '好。不好。很好, 赞')
+            concept_results = model.match(text)
+            self.assertEqual([x.text for x in concept_results['A']], ['好', '好'])
+            self.assertEqual([x.text for x in concept_results['B']], ['好', '很', '好', '赞'])
+
+            # 规则树仍然保留, 嵌套的 OrRule 编译成一个匹配函数
+            concept = model.concept_mgr['B']
+            self.assertIn('OrRule', six.text_type(concept.rules_filters[0]))
+            self.assertEqual(len(concept.rule_matches), 1)
+
+            loaded_model = pickle.loads(pickle.dumps(model))
+            loaded_results = loaded_model.match(text)
+            self.assertEqual(sorted(loaded_results.keys()), sorted(concept_results.keys()))
+            for name, results in loaded_results.items():
+                self.assertEqual([x.key for x in results], [x.key for x in concept_results[name]])
+        finally:
+            shutil.rmtree(rule_dir_path)
+
+    def test_shared_nodes(self):
+        """
+        测试概念之间共享结构相同的子规则
+        """
+        rule_dir_path = make_rule_dir({
+            'A': '$ord(@d2, $or("不", "没"), "好")\n',
+            'B': '$ord(@d2, $or("不", "没"), "快")\n',
+            'C': '$or($or("不", "没"), "很")\n',
+        })
+        try:
+            model = Model.train(Config(force_concept_size_one=False), rule_dir_path)
+            share_stats = model.concept_mgr.share_stats
+            self.assertEqual(share_stats['shared'], 1)
+            self.assertEqual(share_stats['deduplicated'], 2)
+
+            text = Text(config, '不好。没快。很好')
+            concept_results = model.match(text)
+            self.assertEqual([x.text for x in concept_results['A']], ['不好'])
+            self.assertEqual([x.text for x in concept_results['B']], ['没快'])
+            self.assertEqual([x.text for x in concept_results['C']], ['不', '没', '很'])
+
+            # 与不共享时单独编译的规则结果相同
+            for name, results in concept_results.items():
+                rule_match = model.concept_mgr[name].rules_filters[0].compile()
+                self.assertEqual([x.key for x in rule_match(TextContext(text, model.concept_mgr))], [x.key for x in results])
+
+            loaded_model = pickle.loads(pickle.dumps(model))
+            self.assertEqual(loaded_model.concept_mgr.share_stats, share_stats)
+            loaded_results = loaded_model.match(text)
+            for name, results in loaded_results.items():
+                self.assertEqual([x.key for x in results], [x.key for x in concept_results[name]])
+        finally:
+            shutil.rmtree(rule_dir_path)
+
+    def test_results_order(self):
+        """
+        测试乱序添加的 Results 合并后仍然有序
+        """
+        text = Text(config, '好快递很给力赞')
+        words = [text.word_map[x][0] for x in text.word_list]
+        unordered = Results()
+        unordered.add(words[3], words[0], words[5], words[0])
+        self.assertFalse(unordered.ordered)
+
+        for first in ([], [words[4], words[1]]):
+            results = Results()
+            results.add(*first)
+            results.add(unordered)
+            expected = sorted(set(first + [words[0], words[3], words[5]]), key=lambda x: x.key)
+            self.assertEqual(list(results), expected)
+            self.assertEqual(list(results.slice_by_beg(3)), [x for x in expected if x.beg_index.offset >= 3])
+
+        # 被合并的 Results 本身也变成有序的
+        self.assertEqual(list(unordered), [words[0], words[3], words[5]])
+
+    def assert_join(self, rule_format, compose):
+        """
+        对比连接规则与参照实现的结果, 覆盖所有的范围单位, concept 长度强制和不强制为 1 两种情况
+        :param rule_format: 规则模板, 使用 {unit} 和 {n} 表示范围参数
+        :param compose: 参照实现的组合函数, 见 naive_join
+        """
+        ranges = [('d', 2), ('d', 4), ('w', 3), ('w', 6), ('s', 1), ('s', 2), ('p', 1), ('p', 2), ('t', 1)]
+        rules = {
+            'X': '$or("好", $seq(@d2, "很", "好"), $ord(@d3, "快递", "好"))\n',
+            'Y': '$or("赞", "好", $seq(@d2, "很", "赞"))\n',
+        }
+        for unit, n in ranges:
+            rules['J_{0}{1}'.format(unit, n)] = rule_format.format(unit=unit, n=n) + '\n'
+        rule_dir_path = make_rule_dir(rules)
+        try:
+            for join_config in (config, config_concept_size_one):
+                model = Model.train(join_config, rule_dir_path)
+                for line in random_texts(len(rules)):
+                    text = Text(join_config, line)
+                    for unit, n in ranges:
+                        rule = model.concept_mgr['J_{0}{1}'.format(unit, n)].rules_filters[0]
+                        context = TextContext(text, model.concept_mgr)
+                        columns = [arg.match(context) for arg in rule.args[1:]]
+                        expected = naive_join(rule.args[0], columns, compose)
+                        rule_match = rule.compile()
+                        self.assertEqual([x.key for x in rule_match(context)], expected, (line, unit, n))
+                        # 限制数目时至少包含最早的 limit 个结果
+                        for limit in (1, 3):
+                            keys = [x.key for x in rule_match(TextContext(text, model.concept_mgr), limit)]
+                            self.assertGreaterEqual(len(keys), min(limit, len(expected)))
+                            self.assertEqual(keys, expected[:len(keys)])
+        finally:
+            shutil.rmtree(rule_dir_path)
+
+    def test_ord_join(self):
+        """
+        测试有序连接与笛卡尔积枚举的结果一致
+        """
+        self.assert_join('$ord(@{unit}{n}, %X, %Y, %X)', naive_ord)
+
+    def test_seq_join(self):
+        """
+        测试连续连接与笛卡尔积枚举的结果一致
+        """
+        self.assert_join('$seq(@{unit}{n}, %X, %Y, %X)', naive_seq)
+
+    def test_bag_join(self):
+        """
+        测试无序连接与笛卡尔积枚举的结果一致
+        """
+        self.assert_join('$bag(@{unit}{n}, %X, %Y, %X)', naive_bag)
+
+    def test_filter_range(self):
+        """
+        测试规则过滤与逐个比较的参照实现结果一致, 覆盖所有的范围单位以及前向/重叠/后向过滤
+        """
+        ranges = ['0', 'd1', 'd2', 'w2', 'w4', 's1', 's2', 'p1', 't1']
+        filter_ranges = [(forward, overlap, backward)
+                         for forward in ranges for overlap in (0, 1) for backward in ranges
+                         if (forward, overlap, backward) != ('0', 0, '0')]
+        rules = {
+            'X': '$or("好", $seq(@d2, "很", "好"), $ord(@d3, "快递", "好"))\n',
+            'Y': '$or("赞", "好", $seq(@d2, "很", "赞"))\n',
+        }
+        for i, filter_range in enumerate(filter_ranges):
+            rules['F{0}'.format(i)] = '$or(!filt($arg(%X), @[{0}, {1}, {2}], %Y), "不")\n'.format(*filter_range)
+        rule_dir_path = make_rule_dir(rules)
+        try:
+            model = Model.train(config, rule_dir_path)
+            for line in random_texts(len(rules)):
+                text = Text(config, line)
+                context = TextContext(text, model.concept_mgr)
+                target_results = context.match_concept('X')
+                filter_results = context.match_concept('Y')
+                for i, filter_range in enumerate(filter_ranges):
+                    rule_filter = model.concept_mgr['F{0}'.format(i)].rules_filters[0].args[0]
+                    expected = [x.key for x in target_results
+                                if not naive_filtered(rule_filter.args[1], x, filter_results)]
+                    rule_match = rule_filter.compile()
+                    self.assertEqual([x.key for x in rule_match(context)], expected, (line, filter_range))
+                    # 限制数目时返回最早的 limit 个结果
+                    for limit in (1, 3):
+                        keys = [x.key for x in rule_match(TextContext(text, model.concept_mgr), limit)]
+                        self.assertEqual(keys, expected[:limit])
+        finally:
+            shutil.rmtree(rule_dir_path)
+
+    def test_result_value(self):
+        """
+        测试 Index 和 Result 不可修改, 并且按值比较
+        """
+        text = Text(config, '好快递。很给力赞')
+        other_text = Text(config, '好快递。很给力赞')
+        result = text.word_map['很'][0]
+        other_result = other_text.word_map['很'][0]
+
+        # 不同文本对象中相同位置的结果相等, 可以用来去重
+        self.assertIsNot(result, other_result)
+        self.assertEqual(result, other_result)
+        self.assertEqual(hash(result), hash(other_result))
+        self.assertEqual(result.beg_index, other_result.beg_index)
+        self.assertEqual(len({result, other_result, text.word_map['赞'][0]}), 2)
+        self.assertLess(text.word_map['好'][0].beg_index, result.beg_index)
+
+        # 不可修改, 也没有 __dict__
+        with self.assertRaises(AttributeError):
+            result.bias = 1
+        with self.assertRaises(AttributeError):
+            result.beg_index.offset = 0
+        self.assertFalse(hasattr(result, '__dict__'))
+        self.assertFalse(hasattr(result.beg_index, '__dict__'))
+
+        # with_bias 生成新的结果, 原结果不变
+        self.assertIs(result.with_bias(result.bias), result)
+        biased = result.with_bias(result.bias + 1)
+        self.assertNotEqual(biased, result)
+        self.assertEqual(biased.key, (result.beg_index.offset, result.end_index.offset, result.bias + 1))
+        self.assertEqual(result.bias, 0)
+
+        loaded = pickle.loads(pickle.dumps(biased))
+        self.assertEqual(loaded, biased)
+        self.assertEqual(loaded.beg_index.psw_index, biased.beg_index.psw_index)
+        self.assertEqual(loaded.text, '很')
+
 
 if __name__ == '__main__':
     test_suite = unittest.TestSuite()
     test_suite.addTest(TestCase('test_load_text'))
     test_suite.addTest(TestCase('test_rules'))
     test_suite.addTest(TestCase('test_concept_size_one'))
+    test_suite.addTest(TestCase('test_concept_graph'))
+    test_suite.addTest(TestCase('test_concept_cache'))
+    test_suite.addTest(TestCase('test_prune_concepts'))
+    test_suite.addTest(TestCase('test_text_reuse'))
+    test_suite.addTest(TestCase('test_match_many'))
+    test_suite.addTest(TestCase('test_save_load'))
+    test_suite.addTest(TestCase('test_train_workers'))
+    test_suite.addTest(TestCase('test_reload'))
+    test_suite.addTest(TestCase('test_reload_shared'))
+    test_suite.addTest(TestCase('test_fast_char_cut'))
+    test_suite.addTest(TestCase('test_shared_nlp'))
+    test_suite.addTest(TestCase('test_result_cache'))
+    test_suite.addTest(TestCase('test_sent_cache'))
+    test_suite.addTest(TestCase('test_match_long'))
+    test_suite.addTest(TestCase('test_match_append'))
+    test_suite.addTest(TestCase('test_exists_mode'))
+    test_suite.addTest(TestCase('test_exists_short_circuit'))
+    test_suite.addTest(TestCase('test_top_mode'))
+    test_suite.addTest(TestCase('test_result_text'))
+    test_suite.addTest(TestCase('test_compiled_plan'))
+    test_suite.addTest(TestCase('test_shared_nodes'))
+    test_suite.addTest(TestCase('test_results_order'))
+    test_suite.addTest(TestCase('test_ord_join'))
+    test_suite.addTest(TestCase('test_seq_join'))
+    test_suite.addTest(TestCase('test_bag_join'))
+    test_suite.addTest(TestCase('test_filter_range'))
+    test_suite.addTest(TestCase('test_result_value'))
 
     unittest.TextTestRunner(verbosity=2).run(test_suite)